@@ -1,25 +1,53 @@
 # backend.py
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.exception_handlers import request_validation_exception_handler
 from fastapi.responses import HTMLResponse, Response, FileResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 import os
+import stat as stat_mode
+import hashlib
 import logging
+import logging.handlers
+import queue
+import atexit
 import time
 import threading
 import sys
 import webbrowser
 import re
 import random
+import datetime
+from functools import lru_cache
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, Optional
+import httpx
+from cachetools import TTLCache, TLRUCache
+
+try:
+    from fastrlock.rlock import FastRLock as _StateLock
+except ImportError:
+    # fastrlock is optional; its C lock is cheaper on the uncontended path than threading.RLock.
+    # The fallback must be reentrant as well, so a path that re-acquires a stripe behaves the same.
+    _StateLock = threading.RLock
 
 # Import modules
-from src.models import ChatRequest, CredentialsSaveRequest, CredentialsResponse
-from src.credentials import save_credentials, load_credentials, delete_credentials
-from src.moodle_scraper import scrape_moodle_text
+from src.models import (
+    ChatRequest, CredentialsSaveRequest, CredentialsResponse, OAuthCallbackRequest, RefreshTokenRequest,
+    CalendarEventsRequest, CreateEventRequest, UpdateEventRequest, DeleteEventRequest, BatchEventRequest
+)
+from src.credentials import save_credentials, load_credentials, delete_credentials, get_credentials_dir
+from src.moodle_scraper import scrape_moodle_text, parse_moodle_entries
 from src.stine_exam_scraper import scrape_stine_exams
-from src.llm import ask_chatgpt_moodle, ask_chatgpt_exams, ask_chatgpt_topic_help, determine_intent, pick_api_key
-from src.ics_calendar import make_calendar_entries, extract_events_from_ics
-from src.utils import resolve_frontend_dist
+from src.driver_pool import DriverPool
+from src.llm import ask_chatgpt_moodle, ask_chatgpt_moodle_structured, ask_chatgpt_exams, ask_chatgpt_all_appointments, ask_chatgpt_topic_help, determine_intent, intent_cache_info, pick_api_key
+from src.ics_calendar import make_calendar_entries, extract_events_from_ics, DEBUG_ICS_DIR
+from src.utils import resolve_frontend_dist, FastJSONResponse, HTTP2_AVAILABLE
 from evaluation_logger import start_turn, end_turn
 from src.google_calendar import (
     exchange_code_for_token,
@@ -40,20 +68,24 @@ except Exception:
     # If python-dotenv isn't installed, that's okay — environment variables may be set elsewhere.
     pass
 
-# Configure logging to show INFO and above messages in console
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout)  # Output to console/terminal
-    ]
-)
-
-# Note: selenium and bs4 imports are moved into the scraping function so the
+# Configure logging to show INFO and above messages in console.
+# Request handlers only put records on a queue; a background listener thread formats
+# and writes them, so console I/O never runs on the request path.
+_console_handler = logging.StreamHandler(sys.stdout)  # Output to console/terminal
+_console_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+_log_queue = queue.Queue(-1)
+_queue_handler = logging.handlers.QueueHandler(_log_queue)
+_queue_handler.setFormatter(logging.Formatter('%(message)s'))
+logging.basicConfig(level=logging.INFO, handlers=[_queue_handler])
+_log_listener = logging.handlers.QueueListener(_log_queue, _console_handler, respect_handler_level=True)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+# Module-level logger so this module's output can be tuned/disabled independently
+logger = logging.getLogger(__name__)
+
+# Note: selenium imports are moved into the scraping function so the
 # FastAPI app can start even when Selenium/chromedriver aren't installed.
 
-latestMessage = ""
-
 # ============================================================================
 # Emotional Response System
 # ============================================================================
@@ -148,6 +180,29 @@ EMOTIONAL_PATTERNS = {
 }
 
 
+# Keywords for the wizard's cancel/negative-answer checks
+_CANCEL_KEYWORDS = ["exit", "abbruch", "abbrechen", "stop", "beenden", "nein danke", "nicht mehr"]
+# Single-word negations must match whole words to avoid catching words like "linear"
+_NEGATIVE_TOKEN_RE = re.compile(r"\b(?:nein|no|nope|kein|keine|nö)\b")
+# Negative phrases are matched as substrings
+_NEGATIVE_PHRASES = [
+    "gar keine", "mir egal", "egal", "alle", "alles", "alle themen",
+    "keine ahnung", "weiß nicht", "keine idee", "keine spezifischen", "kein topic",
+]
+_UNSURE_KEYWORDS = ["weiß nicht", "keine ahnung", "unsicher", "keins"]
+# Wizard step 5/6 replies: no own questions / continue with the next topic
+_NO_QUESTIONS_KEYWORDS = ["keine", "kein", "nein"]
+_NEXT_TOPIC_KEYWORDS = ["weiter", "nächste", "next"]
+# Whole-reply sets for wizard steps 2 (topics that are not topics) and 4 (no materials)
+_NON_TOPIC_REPLIES = frozenset(("keins", "keine", "keine ahnung", "unsicher", "weiß nicht"))
+_NO_MATERIALS_REPLIES = frozenset(("kein upload", "kein", "keine", "kein material"))
+# Wizard triggers may also appear inside a longer sentence, so they need a substring scan
+_WIZARD_TRIGGERS = ("klausurvorbereitung", "exam wizard", "wizard starten")
+# Emotional messages that also ask for help (optionally about exam preparation)
+_HELP_REQUEST_KEYWORDS = ['hilfe', 'helfen', 'unterstützen', 'kannst du', 'könntest du', 'würdest du']
+_EXAM_TOPIC_KEYWORDS = ['klausur', 'prüfung', 'vorbereitung', 'lernen', 'thema']
+
+
 def detect_emotion(message: str):
     """Erkennt Gefühlsäußerungen in Nachrichten und gibt passende Antwort zurück.
     
@@ -157,28 +212,231 @@ def detect_emotion(message: str):
     Returns:
         Tuple (emotion_category, response) oder (None, None) wenn keine Gefühlsäußerung erkannt wurde
     """
-    msg_lower = message.lower()
-    
-    # Durchsuche alle Gefühlskategorien
+    category, keyword = _classify_emotion(message.strip().lower())
+    if category is None:
+        return None, None
+
+    # Wähle zufällige Antwort aus den möglichen Antworten (bewusst nicht gecacht)
+    response = random.choice(EMOTIONAL_PATTERNS[category]['responses'])
+    logger.info("[Emotion] Detected '%s' emotion with keyword '%s'", category, keyword)
+    return category, response
+
+
+@lru_cache(maxsize=4096)
+def _classify_emotion(norm_msg: str):
+    """Gecachte Klassifikation: (emotion_category, keyword) oder (None, None) für eine normalisierte Nachricht."""
+    # Durchsuche alle Gefühlskategorien in ihrer Reihenfolge
     for category, data in EMOTIONAL_PATTERNS.items():
         for keyword in data['keywords']:
             # Keyword muss als ganzes Wort oder Teil eines Satzes vorkommen
-            if keyword in msg_lower:
-                # Wähle zufällige Antwort aus den möglichen Antworten
-                response = random.choice(data['responses'])
-                logging.info(f"[Emotion] Detected '{category}' emotion with keyword '{keyword}'")
-                return category, response
-    
+            if keyword in norm_msg:
+                return category, keyword
+
     return None, None
 
 
+# ============================================================================
+# Keyword Intent Shortcuts
+# ============================================================================
+
+# Exact (whole message) keyword -> intent; resolved with a single dict lookup before the LLM
+_KEYWORD_INTENTS = {
+    "settings": "settings",
+    "/settings": "settings",
+    "einstellungen": "settings",
+    "erinnerungseinstellungen": "settings",
+    "/moodle": "get_moodle_appointments",
+    "/exams": "get_stine_exams",
+    "/stine": "get_stine_exams",
+    "/mail": "get_mail",
+    "hilfe": "help",
+    "help": "help",
+    "/help": "help",
+    "hallo": "greeting",
+    "hi": "greeting",
+    "hey": "greeting",
+    "moin": "greeting",
+    "servus": "greeting",
+    "klausurvorbereitung": "start_exam_wizard",
+    "exam wizard": "start_exam_wizard",
+    "wizard starten": "start_exam_wizard",
+}
+
+# Short replies to the "Soll ich dir die Termine auch in deinen Kalender eintragen?" question
+_AFFIRMATIVE_REPLIES = frozenset(("ja", "j", "yes", "y", "klar", "gerne"))
+_NEGATIVE_REPLIES = frozenset(("nein", "n", "no"))
+_YES_NO_REPLIES = _AFFIRMATIVE_REPLIES | _NEGATIVE_REPLIES
+
+# ============================================================================
+# Static Bot Replies
+# ============================================================================
+
+WIZARD_ENDED_MSG = "Wizard beendet. Sag Bescheid, wenn ich wieder helfen soll."
+GREETING_MSG = "Hallo! Wie kann ich dir helfen?"
+CALENDAR_NO_MSG = "Alles klar. Mit was kann ich dir sonst helfen?"
+NOT_UNDERSTOOD_MSG = "Entschuldigung, ich habe dich nicht verstanden. Du erhälst eine Auflistung meiner Funktionen, wenn du 'Hilfe' schreibst."
+HELP_MSG = (
+    "Ich kann dir bei folgenden Dingen helfen:\n\n"
+    "- Moodle-Termine und Deadlines abrufen\n"
+    "- Stine-Prüfungstermine abrufen\n"
+    "- Erinnerungseinstellungen konfigurieren\n"
+    "- Kalendertermine hinzufügen\n"
+    " - dich bei der Klausurvorbereitung unterstützen\n\n"
+)
+# Appended to an empathic reply (joined with a space) when the message also asks for help
+EMOTION_HELP_WIZARD_MSG = "Ich kann dir bei der Klausurvorbereitung helfen! Möchtest du den Klausur-Wizard starten? (Schreibe 'Klausurvorbereitung' oder 'Hilfe' für mehr Optionen)"
+EMOTION_HELP_GENERIC_MSG = (
+    "Ich kann dir bei verschiedenen Dingen helfen:\n\n"
+    "- Moodle-Termine und Deadlines abrufen\n"
+    "- Stine-Prüfungstermine abrufen\n"
+    "- Klausurvorbereitung\n"
+    "- Kalendertermine hinzufügen\n\n"
+    "Was kann ich für dich tun?"
+)
+EMOTION_ONLY_MSG = "Wie kann ich dir noch helfen?"
+STINE_MESSAGES_MSG = "Die Funktion zum Abrufen von Stine-Nachrichten ist noch nicht implementiert."
+MAIL_MSG = "Die Funktion zum Abrufen von E-Mails ist noch nicht implementiert."
+
+# Intents whose answers never include an empathic prefix, so emotion detection is skipped
+_NO_EMOTION_INTENTS = frozenset((
+    "calendar_yes", "calendar_no", "greeting", "help", "settings", "get_mail",
+    "start_exam_wizard", "stop_exam_wizard",
+))
+
+
 # ============================================================================
 # Global State Management
 # ============================================================================
 
 FRONTEND_DIST = resolve_frontend_dist()
 
-app = FastAPI()
+# Allowed names for /download_ics; no path separators, so lookups stay inside DEBUG_ICS_DIR
+_ICS_PATTERN = re.compile(r"^debug_ics_response_[A-Za-z0-9_.-]{1,64}\.ics$")
+
+# Scraper failures are reported as a short message (e.g. "Fehler beim Scraping: ..."), so the
+# markers are always at the start of the output; only that prefix is scanned
+_SCRAPER_ERROR_RE = re.compile(r"Fehler|nicht verfügbar|Selenium|WebDriver|Chrome|Failed|Exception")
+_SCRAPER_ERROR_SCAN_CHARS = 4096
+
+# Max. number of concurrently running (and kept-alive) Chrome sessions for scraping
+DRIVER_POOL_SIZE = 4
+
+# Threads of the default executor behind asyncio.to_thread (LLM requests, credential file access)
+BLOCKING_POOL_SIZE = 32
+
+# Max. number of concurrent event inserts sent to Google (stays below its rate limits)
+GOOGLE_CREATE_CONCURRENCY = 8
+_google_create_semaphore = asyncio.Semaphore(GOOGLE_CREATE_CONCURRENCY)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled HTTP client for all outbound calls (Google OAuth / Calendar),
+    # so connections and TLS sessions are reused instead of opened per request.
+    app.state.http = httpx.AsyncClient(
+        http2=HTTP2_AVAILABLE,
+        timeout=httpx.Timeout(10.0, connect=3.0),
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+    )
+    # Chrome sessions for the scrapers; started on first use and reused afterwards
+    app.state.driver_pool = DriverPool(size=DRIVER_POOL_SIZE)
+    # Dedicated threads for the (slow, blocking) scrapes, so they cannot occupy the default
+    # thread pool that quick blocking calls (LLM requests, file access) run on
+    app.state.scrape_pool = ThreadPoolExecutor(max_workers=DRIVER_POOL_SIZE, thread_name_prefix="scrape")
+    # Bound the default executor explicitly instead of relying on the cpu_count-based default
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=BLOCKING_POOL_SIZE, thread_name_prefix="blocking")
+    )
+    # Start one Chrome in the background; later ones start lazily as concurrent scrapes need them
+    prestart = asyncio.get_running_loop().run_in_executor(app.state.scrape_pool, app.state.driver_pool.prewarm)
+    _background_tasks.add(prestart)
+    prestart.add_done_callback(_finish_background_task)
+    # Read and decrypt the stored credentials (device key derivation included) in the
+    # background, so the frontend's first /credentials/load is answered from the cache
+    warmup = asyncio.create_task(asyncio.to_thread(load_credentials))
+    _background_tasks.add(warmup)
+    warmup.add_done_callback(_finish_background_task)
+    try:
+        yield
+    finally:
+        await app.state.http.aclose()
+        app.state.scrape_pool.shutdown(wait=False, cancel_futures=True)
+        await asyncio.to_thread(app.state.driver_pool.close)
+
+
+async def _run_scrape(func, *args):
+    """Run a blocking scraper function on the scrape thread pool."""
+    return await asyncio.get_running_loop().run_in_executor(app.state.scrape_pool, func, *args)
+
+
+# How long calendar_yes waits for calendar entries prebuilt in the background
+ICS_PREBUILD_TIMEOUT_SECONDS = 20
+# Strong references to running background tasks (the event loop only keeps weak ones)
+_background_tasks = set()
+
+
+# LLM calls currently running, by cache key. Concurrent requests that would produce the same
+# cached result (e.g. a course group asking right after a deadline was posted) await one
+# shared call instead of each starting their own. Only touched from the event loop.
+_inflight_calls: dict = {}
+
+
+async def _coalesced(key, func, *args):
+    """Run func(*args) in a thread, sharing one call between concurrent requests with the same key."""
+    task = _inflight_calls.get(key)
+    if task is None:
+        task = asyncio.ensure_future(asyncio.to_thread(func, *args))
+        _inflight_calls[key] = task
+        task.add_done_callback(lambda _: _inflight_calls.pop(key, None))
+    # shield: a cancelled waiter (e.g. a dropped calendar prebuild) must not cancel the others
+    return await asyncio.shield(task)
+
+
+# Generated ICS text per (hash of the appointments, date): several users of the same courses,
+# or one user asking twice, get the calendar entries without another LLM call. The date is
+# part of the key because the prompt resolves missing years relative to today.
+ICS_CACHE_TTL_SECONDS = 3600
+_ics_cache = TTLCache(maxsize=512, ttl=ICS_CACHE_TTL_SECONDS)
+_ics_cache_lock = threading.Lock()
+
+
+async def _calendar_entries(termine: str, api_key: Optional[str]) -> str:
+    """Return the ICS text for the appointments, from the cache or via make_calendar_entries."""
+    key = (hash(termine), datetime.date.today())
+    with _ics_cache_lock:
+        cached = _ics_cache.get(key)
+    if cached is not None:
+        return cached
+    _, ics_content = await _coalesced(('ics',) + key + (api_key,), make_calendar_entries, termine, api_key)
+    # Error texts ("Kein API-Key vorhanden ...") are not ICS and must not be cached
+    if "BEGIN:VEVENT" in ics_content:
+        with _ics_cache_lock:
+            _ics_cache[key] = ics_content
+    return ics_content
+
+
+# Users whose last answer to the calendar question was "ja". Only for them are the calendar
+# entries prebuilt, so a "nein" or an unanswered question costs no extra LLM call; everyone
+# else gets them generated on "ja" (and cached in _ics_cache). Only touched from the event loop.
+CALENDAR_ACCEPTED_TTL_SECONDS = 7 * 24 * 3600
+_calendar_accepted = TTLCache(maxsize=10_000, ttl=CALENDAR_ACCEPTED_TTL_SECONDS)
+
+
+def _prebuild_calendar_entries(username: str, termine: str, api_key: str):
+    """Start generating the calendar entries while the user answers the calendar question.
+
+    Returns None for users who have not accepted the calendar question before.
+    """
+    if username not in _calendar_accepted:
+        return None
+    task = asyncio.create_task(_calendar_entries(termine, api_key))
+    _background_tasks.add(task)
+    task.add_done_callback(_finish_background_task)
+    return task
+
+
+# Plain dict/model results are serialized with orjson (stdlib json fallback) as well
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -186,12 +444,71 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"]
 )
+# Compress the JS bundle, index.html and larger JSON bodies (calendar event lists); small
+# replies and probes below minimum_size go out as-is, where gzip would only cost CPU
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
+
+@app.exception_handler(RequestValidationError)
+async def _validation_error_handler(request: Request, exc: RequestValidationError):
+    """Keep the /api/google/* error contract: a missing or empty field answers 200 with
+    {"success": False, "message": "Missing ..."}, which the frontend shows via data.message."""
+    if not request.url.path.startswith("/api/google/"):
+        return await request_validation_exception_handler(request, exc)
+    fields = []
+    for err in exc.errors():
+        loc = [str(part) for part in err.get("loc", ()) if part != "body"]
+        name = ".".join(loc) or "request body"
+        if name not in fields:
+            fields.append(name)
+    logger.error("Invalid request to %s: %s", request.url.path, fields)
+    body = {"success": False, "message": f"Missing {', '.join(fields)}"}
+    if request.url.path == "/api/google/calendar/create_batch":
+        body["results"] = []
+    return FastJSONResponse(body)
 
 # Simple in-memory conversation state to track when the bot asked the calendar question.
-# Keyed by username -> { 'awaiting_calendar': bool, 'ts': float }
-conversation_state = {}
-state_lock = threading.Lock()
+# Keyed by username -> { 'awaiting_calendar': bool, ... }; an entry expires STATE_EXPIRY_SECONDS
+# after it was last written, so every change has to go through _set_state to keep it alive.
 STATE_EXPIRY_SECONDS = 120  # consent expires after 2 minutes
+conversation_state = TTLCache(maxsize=10_000, ttl=STATE_EXPIRY_SECONDS)
+# TTLCache itself is not thread-safe: _store_lock guards single cache operations, while the
+# per-user lock stripes serialize read-modify-write sequences without blocking other users.
+_store_lock = _StateLock()
+_STATE_LOCK_STRIPES = tuple(_StateLock() for _ in range(64))
+
+
+def _state_lock(username: str):
+    return _STATE_LOCK_STRIPES[hash(username) % len(_STATE_LOCK_STRIPES)]
+
+
+def _get_state(username: str):
+    with _store_lock:
+        return conversation_state.get(username)
+
+
+def _set_state(username: str, state: dict):
+    """Store the user's state and restart its expiry timer."""
+    with _store_lock:
+        conversation_state[username] = state
+
+
+def _pop_state(username: str):
+    with _store_lock:
+        return conversation_state.pop(username, None)
+
+
+def _clear_wizard(username: str):
+    """Drop the wizard from the user's state (and the state itself if nothing else is left)."""
+    with _state_lock(username):
+        state = _get_state(username)
+        if state is None:
+            return
+        state.pop('wizard', None)
+        if state:
+            _set_state(username, state)
+        else:
+            _pop_state(username)
 
 # Wizard flow - simple sequential steps (1-6)
 # Step 1: Ask for module
@@ -202,15 +519,86 @@ STATE_EXPIRY_SECONDS = 120  # consent expires after 2 minutes
 # Step 6: Answer and offer to continue with next topic
 
 # Cache for scraped data to avoid expensive re-scraping
-# Keyed by (username, data_type) -> { 'raw_data': str, 'ts': float }
-scraper_cache = {}
+# Keyed by (username, data_type) -> { 'raw_data': str, 'parsed': dict | None }
+# Each data type has its own lifetime: deadlines/exams change more often than course lists.
+SCRAPER_CACHE_TTL_SECONDS = {
+    'moodle': 300,
+    'stine_exams': 600,
+}
+CACHE_EXPIRY_SECONDS = 3600  # fallback for data types without their own TTL
+
+
+def _scraper_cache_ttu(key, value, now):
+    return now + SCRAPER_CACHE_TTL_SECONDS.get(key[1], CACHE_EXPIRY_SECONDS)
+
+
+scraper_cache = TLRUCache(maxsize=10_000, ttu=_scraper_cache_ttu)
 cache_lock = threading.Lock()
-CACHE_EXPIRY_SECONDS = 3600  # cache expires after 1 hour
+
+class _HashedAssetFiles(StaticFiles):
+    """StaticFiles for Vite's build assets, whose names contain a content hash.
+
+    A changed asset gets a new name, so browsers may keep every file for good instead of
+    revalidating it (If-None-Match round trip) on each page load.
+    """
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
 
 if FRONTEND_DIST:
     assets_path = os.path.join(FRONTEND_DIST, "assets")
     if os.path.isdir(assets_path):
-        app.mount("/assets", StaticFiles(directory=assets_path), name="assets")
+        app.mount("/assets", _HashedAssetFiles(directory=assets_path), name="assets")
+
+
+def _load_spa_files(dist):
+    """Read index.html once and list the other top-level files of the frontend build.
+
+    Returns:
+        Tuple of (index.html bytes or None, dict of top-level file name -> absolute path)
+    """
+    if not dist:
+        return None, {}
+    index_path = os.path.join(dist, "index.html")
+    index_html = None
+    if os.path.isfile(index_path):
+        with open(index_path, "rb") as f:
+            index_html = f.read()
+    files = {
+        name: path for name in os.listdir(dist)
+        if name != "index.html" and os.path.isfile(path := os.path.join(dist, name))
+    }
+    return index_html, files
+
+
+# SPA routes are answered from memory instead of stat-ing and re-reading index.html per request
+INDEX_HTML, _SPA_STATIC_FILES = _load_spa_files(FRONTEND_DIST)
+# index.html only changes with a new build (and process), so its ETag is computed once. The browser
+# revalidates on every navigation (no-cache) and gets an empty 304 while the build is unchanged.
+_INDEX_HEADERS = {
+    "ETag": f'"{hashlib.blake2b(INDEX_HTML, digest_size=16).hexdigest()}"',
+    "Cache-Control": "no-cache",
+} if INDEX_HTML is not None else {}
+
+# Bodiless responses never change, so one instance each is shared by all requests
+_NOT_FOUND_RESPONSE = Response(status_code=404)
+_FAVICON_RESPONSE = Response(status_code=204)
+# Landing page when no frontend build is present; rendered once at import like the above
+_FALLBACK_HTML_RESPONSE = HTMLResponse(
+    "<html><head><title>Moodle Chat Backend</title></head><body>"
+    "<h1>Moodle Chat Backend</h1>"
+    "<p>Open the <a href='/docs'>API docs</a> to test endpoints or POST to <code>/chat</code>.</p>"
+    "</body></html>"
+)
+
+
+def _index_response(request: Request) -> Response:
+    if request.headers.get("if-none-match") == _INDEX_HEADERS["ETag"]:
+        return Response(status_code=304, headers=_INDEX_HEADERS)
+    return Response(INDEX_HTML, media_type="text/html", headers=_INDEX_HEADERS)
 
 
 def get_cached_scraped_data(username: str, data_type: str):
@@ -221,46 +609,121 @@ def get_cached_scraped_data(username: str, data_type: str):
         data_type: Type of data ('moodle' or 'stine_exams')
 
     Returns:
-        Tuple of (raw_data, None) or (None, None) if cache miss/expired
+        Tuple of (raw_data, parsed) or (None, None) if cache miss/expired
     """
-    cache_key = (username, data_type)
-
     with cache_lock:
-        cached = scraper_cache.get(cache_key)
-        if cached:
-            # Check if cache is still valid
-            if time.time() - cached.get('ts', 0) < CACHE_EXPIRY_SECONDS:
-                logging.info(f"Cache hit for {data_type} scraped data (user: {username})")
-                return cached.get('raw_data'), None
-            else:
-                # Cache expired, remove it
-                logging.info(f"Cache expired for {data_type} scraped data (user: {username})")
-                del scraper_cache[cache_key]
+        cached = scraper_cache.get((username, data_type))
+    if cached:
+        logger.info("Cache hit for %s scraped data (user: %s)", data_type, username)
+        return cached.get('raw_data'), cached.get('parsed')
 
     return None, None
 
 
-def cache_scraped_data(username: str, data_type: str, raw_data: str):
-    """Store scraped raw data in cache (ChatGPT responses are regenerated per request)."""
+def cache_scraped_data(username: str, data_type: str, raw_data: str, parsed: dict = None):
+    """Store scraped raw data in cache (ChatGPT responses are regenerated per request).
+
+    Optionally also stores a parsed, column-oriented representation of the data so
+    follow-up queries can build their prompt from it without re-parsing the raw text.
+    """
     cache_key = (username, data_type)
     with cache_lock:
         scraper_cache[cache_key] = {
             'raw_data': raw_data,
-            'ts': time.time()
+            'parsed': parsed
         }
-    logging.info(f"Cached {data_type} scraped data (user: {username})")
+    logger.info("Cached %s scraped data (user: %s)", data_type, username)
+
+
+def invalidate_scraped_data(username: str, data_type: str = None):
+    """Drop cached scraped data of a user (all data types if data_type is None)."""
+    with cache_lock:
+        keys = [key for key in scraper_cache if key[0] == username and data_type in (None, key[1])]
+        for key in keys:
+            scraper_cache.pop(key, None)
+    if keys:
+        logger.info("Invalidated %d cached scrape(s) (user: %s)", len(keys), username)
+
+
+# Exact-match cache of the LLM summaries: the same question about the same scraped data gets
+# the same answer without another LLM call. Keyed by (kind, normalized message, hash of the
+# data, date), since the Moodle answer names deadlines relative to today.
+RESPONSE_CACHE_TTL_SECONDS = 300
+_response_cache = TTLCache(maxsize=1024, ttl=RESPONSE_CACHE_TTL_SECONDS)
+_response_cache_lock = threading.Lock()
+# Every successful summary ends with this question; error texts do not and are never cached
+CALENDAR_QUESTION = "Soll ich dir die Termine auch in deinen Kalender eintragen?"
+
+
+async def _summarize(kind: str, message: str, raw_data: str, api_key: str, func, data) -> str:
+    """Run an ask_chatgpt_* summary of `data` for `message` in a thread, answering repeated questions from the cache."""
+    key = (kind, message.strip().lower(), hash(raw_data), datetime.date.today())
+    with _response_cache_lock:
+        cached = _response_cache.get(key)
+    if cached is not None:
+        logger.info("[Chat] Answering %s request from the response cache", kind)
+        return cached
+    # Coalescing also keys on the API key: an invalid one must not hand its error to other users
+    response = await _coalesced(key + (api_key,), func, data, api_key, message)
+    if response and CALENDAR_QUESTION in response:
+        with _response_cache_lock:
+            _response_cache[key] = response
+    return response
+
+
+# Messages mentioning Moodle start the scrape while the LLM is still classifying them
+_MOODLE_HINT_RE = re.compile(r"moodle|aufgaben|abgabe|deadline")
+# Messages asking for fresh data ("Termine aktualisieren") bypass the scraper cache
+_FORCE_REFRESH_RE = re.compile(r"aktualisier|neu laden|refresh")
+
+
+async def _scrape_moodle(username: str, password: str):
+    """Scrape Moodle and cache the result.
+
+    Returns:
+        Tuple of (raw_text, parsed); parsed is None if the scraper reported an error
+    """
+    termine = await _run_scrape(scrape_moodle_text, username, password, True, 25, app.state.driver_pool)
+    logger.info("[Chat] Scraper returned %s characters", len(termine))
+    if _SCRAPER_ERROR_RE.search(termine[:_SCRAPER_ERROR_SCAN_CHARS]):
+        return termine, None
+    # Cache raw data together with its parsed entries
+    parsed = parse_moodle_entries(termine)
+    cache_scraped_data(username, 'moodle', termine, parsed)
+    return termine, parsed
+
+
+def _prefetch_moodle(username: str, password: str):
+    """Start a Moodle scrape before the intent is known.
+
+    A running scrape cannot be cancelled, so if the intent turns out to be something else the
+    task just finishes in the background and its result stays in the scraper cache.
+    """
+    task = asyncio.create_task(_scrape_moodle(username, password))
+    _background_tasks.add(task)
+    task.add_done_callback(_finish_background_task)
+    return task
+
+
+def _finish_background_task(task: asyncio.Task):
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("Background task failed: %s", task.exception())
 
 
-def _build_chat_response(response_text: str, username: str = None, settings: dict = None, suggested_events: list = None, ics_filename: str = None, ics: str = None, is_wizard_message: bool = False, is_settings_message: bool = False):
-    """Helper function to build chat response with wizard and settings status."""
+def _build_chat_response(response_text: str, username: str = None, settings: dict = None, suggested_events: list = None, ics_filename: str = None, is_wizard_message: bool = False, is_settings_message: bool = False):
+    """Helper function to build chat response with wizard and settings status.
+
+    The result is returned as a ready-made FastJSONResponse so FastAPI skips its own
+    encoding pass and the payload is serialized by orjson. ICS text never goes inline: clients
+    fetch it from /download_ics by ics_filename, which streams the file from disk.
+    """
     result = {"response": response_text}
     
     # Add wizard status if username provided
     if username:
-        with state_lock:
-            state = conversation_state.get(username, {})
-            wizard = state.get('wizard')
-            result["wizard_active"] = bool(wizard and wizard.get('active'))
+        wizard = (_get_state(username) or {}).get('wizard')
+        result["wizard_active"] = bool(wizard and wizard.get('active'))
     
     # Add is_wizard_message flag
     result["is_wizard_message"] = is_wizard_message
@@ -275,10 +738,8 @@ def _build_chat_response(response_text: str, username: str = None, settings: dic
         result["suggested_events"] = suggested_events
     if ics_filename:
         result["ics_filename"] = ics_filename
-    if ics:
-        result["ics"] = ics
     
-    return result
+    return FastJSONResponse(result)
 
 
 def _new_wizard_state():
@@ -303,21 +764,9 @@ def _parse_topics_list(text: str):
 def _is_negative_response(text: str):
     """Check if user response signals no/none; avoid substring false positives."""
     lowered = text.strip().lower()
-    # Single-word tokens must match whole words to avoid catching words like "linear"
-    token_keywords = ["nein", "no", "nope", "kein", "keine", "nö"]
-    # Phrases are matched as substrings
-    phrase_keywords = [
-        "gar keine", "mir egal", "egal", "alle", "alles", "alle themen",
-        "keine ahnung", "weiß nicht", "keine idee", "keine spezifischen", "kein topic",
-    ]
-
-    for kw in token_keywords:
-        if re.search(rf"\b{re.escape(kw)}\b", lowered):
-            return True
-    for kw in phrase_keywords:
-        if kw in lowered:
-            return True
-    return False
+    if _NEGATIVE_TOKEN_RE.search(lowered):
+        return True
+    return any(kw in lowered for kw in _NEGATIVE_PHRASES)
 
 
 def _extract_topic_index(user_text: str, topics):
@@ -388,15 +837,10 @@ def _handle_wizard_message(username: str, message: str, state: dict, api_key: st
     msg_low = msg.lower()
     
     # Check for cancellation keywords at any step
-    cancel_keywords = ["exit", "abbruch", "abbrechen", "stop", "beenden", "nein danke", "nicht mehr"]
-    if any(kw in msg_low for kw in cancel_keywords):
+    if any(kw in msg_low for kw in _CANCEL_KEYWORDS):
         # Delete wizard state completely on cancellation
-        with state_lock:
-            if username in conversation_state:
-                conversation_state[username].pop('wizard', None)
-                if not conversation_state[username]:  # Remove empty state
-                    del conversation_state[username]
-        return "Wizard beendet. Sag Bescheid, wenn ich wieder helfen soll."
+        _clear_wizard(username)
+        return WIZARD_ENDED_MSG
     
     step = wizard.get('step', 1)
     response = None
@@ -406,7 +850,7 @@ def _handle_wizard_message(username: str, message: str, state: dict, api_key: st
 
     if step == 1:  # Ask for module
         # Check if user gives a negative/unsure response
-        if _is_negative_response(msg) or any(kw in msg_low for kw in ["weiß nicht", "keine ahnung", "unsicher", "keins"]):
+        if _is_negative_response(msg) or any(kw in msg_low for kw in _UNSURE_KEYWORDS):
             response = "Um dir bei der Vorbereitung helfen zu können, muss ich wissen, um welches Modul es geht. Bitte gib den Modulnamen an."
         elif not msg or len(msg) < 2 or not any(c.isalnum() for c in msg):
             response = "Bitte gib einen gültigen Modulnamen ein oder schreibe 'exit' zum Abbrechen."
@@ -423,7 +867,7 @@ def _handle_wizard_message(username: str, message: str, state: dict, api_key: st
         else:
             topics_parsed = _parse_topics_list(msg)
             # Filter out negative responses from parsed topics
-            topics_parsed = [t for t in topics_parsed if not _is_negative_response(t) and t.lower() not in ["keins", "keine", "keine Ahnung", "unsicher", "weiß nicht"]]
+            topics_parsed = [t for t in topics_parsed if not _is_negative_response(t) and t.lower() not in _NON_TOPIC_REPLIES]
             
             if not topics_parsed:
                 response = "Ich habe keine Themen erkannt. Bitte liste die Themen oder Kapitel, getrennt durch Kommas. Wenn du keine spezifischen Themen hast, schreibe einfach 'nein' oder 'keine'."
@@ -460,7 +904,7 @@ def _handle_wizard_message(username: str, message: str, state: dict, api_key: st
 
     elif step == 4:  # Collect materials
         # If user just repeats the topic name or says they have no upload, skip storing as material
-        no_materials = _is_negative_response(msg) or msg_low in ["kein upload", "kein", "keine", "kein material"]
+        no_materials = _is_negative_response(msg) or msg_low in _NO_MATERIALS_REPLIES
         repeats_topic = current_topic and msg_low == current_topic.strip().lower()
 
         wizard.setdefault('materials', {})
@@ -477,7 +921,7 @@ def _handle_wizard_message(username: str, message: str, state: dict, api_key: st
         module = wizard.get('module')
         materials = wizard.get('materials', {}).get(current_topic, "")
         wizard['step'] = 6
-        if any(tok in msg_low for tok in ["keine", "kein", "nein"]):
+        if any(kw in msg_low for kw in _NO_QUESTIONS_KEYWORDS):
             ai_resp = ask_chatgpt_topic_help(module, current_topic, materials, "keine", api_key)
             response = ai_resp + "\n\nStell jederzeit Zwischenfragen oder schreibe 'weiter' für das nächste Thema."
         else:
@@ -485,7 +929,7 @@ def _handle_wizard_message(username: str, message: str, state: dict, api_key: st
             response = ai_resp + "\n\nWenn du fertig bist, schreibe 'weiter' für das nächste Thema."
 
     elif step == 6:  # Follow-up questions or next topic
-        if any(tok in msg_low for tok in ["weiter", "nächste", "next"]):
+        if any(kw in msg_low for kw in _NEXT_TOPIC_KEYWORDS):
             next_idx = current_idx + 1
             if next_idx < len(topics):
                 wizard['current_topic_index'] = next_idx
@@ -493,11 +937,7 @@ def _handle_wizard_message(username: str, message: str, state: dict, api_key: st
                 response = f"Nächstes Thema: '{topics[next_idx]}'. \n\nBeschreibe gerne den Stoff kurz. \n\nWenn du das gerade nicht möchtest, schreibe 'kein upload'."
             else:
                 # All topics done - end wizard
-                with state_lock:
-                    if username in conversation_state:
-                        conversation_state[username].pop('wizard', None)
-                        if not conversation_state[username]:
-                            del conversation_state[username]
+                _clear_wizard(username)
                 return "Du hast alle Themen durchgearbeitet. Wizard beendet. Sag Bescheid, wenn ich wieder helfen soll!"
         else:
             # Follow-up question
@@ -506,35 +946,367 @@ def _handle_wizard_message(username: str, message: str, state: dict, api_key: st
             ai_resp = ask_chatgpt_topic_help(module, current_topic, materials, msg, api_key)
             response = ai_resp + "\n\nSchreibe 'weiter' für das nächste Thema oder frag weiter zu diesem Thema."
 
-    # Update timestamp and persist wizard state
-    with state_lock:
-        conversation_state[username] = state or {}
-        conversation_state[username]['wizard'] = wizard
-        conversation_state[username]['ts'] = time.time()
+    # Persist wizard state (restarts the expiry timer)
+    with _state_lock(username):
+        _set_state(username, {**(state or {}), 'wizard': wizard})
 
     return response
 
 
 @app.get('/download_ics/{filename}')
-def download_ics(filename: str):
-    """Serve a previously saved ICS debug file. Only allow filenames starting with the expected prefix to
+async def download_ics(filename: str, request: Request):
+    """Serve a previously saved ICS debug file. Only allow filenames matching the expected pattern to
     avoid exposing arbitrary files.
+
+    A weak ETag derived from mtime and size lets repeated downloads short-circuit with 304
+    without touching the file contents.
     """
-    if not filename.startswith("debug_ics_response_") or not filename.endswith('.ics'):
-        return Response(status_code=404)
-    debug_dir = os.path.dirname(__file__)
-    path = os.path.join(debug_dir, filename)
-    if not os.path.isfile(path):
-        return Response(status_code=404)
-    # Use FileResponse to stream the file and suggest a download filename
-    return FileResponse(path, media_type='text/calendar', filename=filename)
+    if not _ICS_PATTERN.fullmatch(filename):
+        return _NOT_FOUND_RESPONSE
+    path = os.path.join(DEBUG_ICS_DIR, filename)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return _NOT_FOUND_RESPONSE
+    # Reuse the stat result instead of a second isfile() syscall
+    if not stat_mode.S_ISREG(stat.st_mode):
+        return _NOT_FOUND_RESPONSE
+    etag = f'W/"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    headers = {'ETag': etag, 'Cache-Control': 'private, max-age=3600'}
+    # If-None-Match may list several validators (or '*')
+    if_none_match = request.headers.get('if-none-match', '')
+    if if_none_match.strip() == '*' or etag in (tag.strip() for tag in if_none_match.split(',')):
+        return Response(status_code=304, headers=headers)
+    # FileResponse streams the file (sendfile where available) and suggests a download filename
+    return FileResponse(path, media_type='text/calendar', filename=filename, headers=headers, stat_result=stat)
+
+
+# ============================================================================
+# Chat Intent Handlers
+# ============================================================================
+
+@dataclass
+class _ChatTurn:
+    """Everything an intent handler needs to answer the current /chat request."""
+    request: ChatRequest
+    username: str
+    api_key: str
+    intent: str
+    timer: Any
+    state: Optional[dict]
+    emotion_category: Optional[str] = None
+    emotion_response: Optional[str] = None
+    moodle_prefetch: Optional[asyncio.Task] = None
+
+
+def _reply(turn: _ChatTurn, msg: str, **kwargs):
+    """Log the end of the turn and build the chat response."""
+    end_turn(turn.timer, bot_message=msg, intent=turn.intent)
+    return _build_chat_response(msg, turn.username, **kwargs)
+
+
+def _constant_chat_response(msg: str) -> FastJSONResponse:
+    """Encode a fixed reply once. Only valid where no wizard is active: non-wizard intents
+    clear the wizard before dispatch, so wizard_active is always False for them."""
+    return FastJSONResponse({
+        "response": msg, "wizard_active": False, "is_wizard_message": False, "is_settings_message": False,
+    })
+
+
+def _reply_constant(turn: _ChatTurn, msg: str, prebuilt: FastJSONResponse):
+    end_turn(turn.timer, bot_message=msg, intent=turn.intent)
+    # Without a username the response carries no wizard_active field
+    return prebuilt if turn.username else _build_chat_response(msg)
+
+
+def _static_reply_handler(msg: str):
+    """Handler for intents that always answer with the same text (response encoded once)."""
+    prebuilt = _constant_chat_response(msg)
+
+    async def handler(turn: _ChatTurn):
+        return _reply_constant(turn, msg, prebuilt)
+    return handler
+
+
+def _emotion_prefix(turn: _ChatTurn, source: str) -> str:
+    # Wenn Gefühlsäußerung erkannt wurde, füge empathische Antwort hinzu
+    if not turn.emotion_response:
+        return ""
+    logger.info("[Chat] Adding emotional response to %s request: %s", source, turn.emotion_category)
+    return f"{turn.emotion_response} "
+
+
+async def _chat_start_exam_wizard(turn: _ChatTurn):
+    _set_state(turn.username, {**(turn.state or {}), 'wizard': _new_wizard_state()})
+    response_msg = ("Gern helfe ich dir bei der Klausurvorbereitung.\n\n"
+             " Du kannst den Vorbereitungs-Wizard jederzeit mit 'exit' abbrechen.\n\n"
+             " Damit ich dir helfen kann, muss ich dir zunächst ein paar Fragen stellen.\n"
+             " 1. Um welches Modul geht es?")
+    return _build_chat_response(response_msg, turn.username, is_wizard_message=True)
+
+
+async def _chat_stop_exam_wizard(turn: _ChatTurn):
+    _clear_wizard(turn.username)
+    return _reply(turn, WIZARD_ENDED_MSG, is_wizard_message=True)
+
+
+async def _moodle_data(turn: _ChatTurn):
+    """Cached, prefetched or freshly scraped Moodle data as (raw_text, parsed); parsed is None on error."""
+    cached_data, parsed = get_cached_scraped_data(turn.username, 'moodle')
+    if cached_data:
+        logger.info("[Chat] Using cached Moodle raw data; regenerating response for current query")
+        return cached_data, parsed
+    if turn.moodle_prefetch is not None:
+        logger.info("[Chat] Cache miss - awaiting Moodle scrape started during intent detection")
+        return await turn.moodle_prefetch
+    # Cache miss - scrape and cache the data
+    logger.info("[Chat] Cache miss - starting Moodle scraper")
+    logger.info("[Chat] Username for scraper: %s", turn.request.username)
+    return await _scrape_moodle(turn.request.username, turn.request.password)
+
+
+async def _stine_exams_data(turn: _ChatTurn) -> Optional[str]:
+    """Cached or freshly scraped STINE exam text, or None if the scraper reported an error."""
+    cached_data, _ = get_cached_scraped_data(turn.username, 'stine_exams')
+    if cached_data:
+        logger.info("[Chat] Using cached STINE raw data; regenerating response for current query")
+        return cached_data
+    # Cache miss - scrape and cache the data
+    exams_text = await _run_scrape(scrape_stine_exams, turn.request.username, turn.request.password, app.state.driver_pool)
+
+    # Check if scraper returned an error
+    if _SCRAPER_ERROR_RE.search(exams_text[:_SCRAPER_ERROR_SCAN_CHARS]):
+        logger.warning("[Chat] STINE scraper returned error: %s", exams_text[:100])
+        return None
+
+    # Cache raw data only
+    cache_scraped_data(turn.username, 'stine_exams', exams_text)
+    return exams_text
+
+
+async def _chat_moodle_appointments(turn: _ChatTurn):
+    emotion_prefix = _emotion_prefix(turn, "Moodle")
+    username, api_key = turn.username, turn.api_key
+
+    logger.info("[Chat] Processing Moodle appointments request")
+    try:
+        termine, parsed = await _moodle_data(turn)
+
+        # Check if scraper returned an error
+        if parsed is None:
+            logger.warning("[Chat] Scraper returned error: %s", termine[:100])
+            return _reply(turn, "Moodle ist gerade nicht erreichbar. Bitte versuche es später noch einmal.")
+
+        # Always regenerate the ChatGPT answer so user constraints in the latest message are applied
+        logger.info("[Chat] Asking ChatGPT to format Moodle data for current query")
+        message = turn.request.message
+        if parsed and parsed['titles']:
+            response = await _summarize('moodle', message, termine, api_key, ask_chatgpt_moodle_structured, parsed)
+        else:
+            response = await _summarize('moodle', message, termine, api_key, ask_chatgpt_moodle, termine)
+
+        # Füge empathische Antwort vor die eigentliche Antwort
+        if emotion_prefix:
+            response = emotion_prefix + response
+
+        logger.info("[Chat] ChatGPT response length: %s", len(response))
+
+        # If ChatGPT asked whether to add events to calendar, mark state so the next short reply
+        # can be interpreted as consent/denial. We only set this for the requesting user.
+        if response and CALENDAR_QUESTION in response:
+            # IMPORTANT: Store RAW scraper data, not formatted response
+            _set_state(username, {
+                'awaiting_calendar': True,
+                'raw_termine': termine,
+                'ics_task': _prebuild_calendar_entries(username, termine, api_key),
+            })
+            logger.info("[Chat] Calendar option offered - raw data stored in state")
+        return _reply(turn, response)
+
+    except Exception as e:
+        return _reply(turn, f"Fehler beim Abrufen: {e}")
+
+
+async def _chat_stine_exams(turn: _ChatTurn):
+    emotion_prefix = _emotion_prefix(turn, "STINE")
+    username, api_key = turn.username, turn.api_key
+
+    try:
+        exams_text = await _stine_exams_data(turn)
+        if exams_text is None:
+            return _reply(turn, "STINE ist gerade nicht erreichbar. Bitte versuche es später noch einmal.")
+
+        # Always regenerate the ChatGPT answer so user constraints in the latest message are applied
+        response = await _summarize('stine_exams', turn.request.message, exams_text, api_key, ask_chatgpt_exams, exams_text)
+
+        # Füge empathische Antwort vor die eigentliche Antwort
+        if emotion_prefix:
+            response = emotion_prefix + response
+
+        # If ChatGPT asked whether to add events to calendar, mark state so the next short reply
+        # can be interpreted as consent/denial. We only set this for the requesting user.
+        if response and CALENDAR_QUESTION in response:
+            # IMPORTANT: Store RAW scraper data, not formatted response
+            _set_state(username, {
+                'awaiting_calendar': True,
+                'raw_termine': exams_text,
+                'ics_task': _prebuild_calendar_entries(username, exams_text, api_key),
+            })
+            logger.info("[Chat] Calendar option offered for STINE exams - raw data stored in state")
+        return _reply(turn, response)
+
+    except Exception as e:
+        return _reply(turn, f"Fehler beim Abrufen der Stine-Prüfungen: {e}")
+
+
+async def _chat_all_appointments(turn: _ChatTurn):
+    emotion_prefix = _emotion_prefix(turn, "Moodle/STINE")
+    username, api_key = turn.username, turn.api_key
+
+    logger.info("[Chat] Processing combined Moodle/STINE request")
+    try:
+        # Both scrapes run side by side on the scrape pool, each with its own pooled driver
+        (termine, parsed), exams_text = await asyncio.gather(_moodle_data(turn), _stine_exams_data(turn))
+        sections = []
+        if parsed is not None:
+            sections.append("Moodle-Aufgaben:\n" + termine)
+        if exams_text is not None:
+            sections.append("Stine-Prüfungen:\n" + exams_text)
+        if not sections:
+            return _reply(turn, "Moodle und STINE sind gerade nicht erreichbar. Bitte versuche es später noch einmal.")
+        combined = "\n\n".join(sections)
+
+        response = await _summarize('all_appointments', turn.request.message, combined, api_key, ask_chatgpt_all_appointments, combined)
+        if len(sections) == 1:
+            unavailable = "STINE" if parsed is not None else "Moodle"
+            response = f"({unavailable} ist gerade nicht erreichbar.)\n\n" + response
+
+        # Füge empathische Antwort vor die eigentliche Antwort
+        if emotion_prefix:
+            response = emotion_prefix + response
+
+        if response and CALENDAR_QUESTION in response:
+            # IMPORTANT: Store RAW scraper data, not formatted response
+            _set_state(username, {
+                'awaiting_calendar': True,
+                'raw_termine': combined,
+                'ics_task': _prebuild_calendar_entries(username, combined, api_key),
+            })
+            logger.info("[Chat] Calendar option offered for Moodle/STINE - raw data stored in state")
+        return _reply(turn, response)
+
+    except Exception as e:
+        return _reply(turn, f"Fehler beim Abrufen: {e}")
+
+
+async def _chat_settings(turn: _ChatTurn):
+    # Settings changes start from fresh scraped data
+    invalidate_scraped_data(turn.username)
+    # Start settings configuration dialog
+    _set_state(turn.username, {
+        'configuring_settings': True,
+        'settings_step': 'ask_task_days'
+    })
+    msg = "**Lass uns deine Erinnerungseinstellungen konfigurieren!** \n\nWie viele Tage vor einer Aufgaben-Deadline möchtest du erinnert werden? (z.B. 1 für einen Tag vorher, 3 für drei Tage vorher)"
+    return _reply(turn, msg, is_settings_message=True)
+
+
+async def _chat_calendar_yes(turn: _ChatTurn):
+    # proceed to create calendar entries
+    # Get the RAW data (not formatted response) and consume the state
+    state = _pop_state(turn.username) or {}
+    termine = state.get('raw_termine')
+    ics_task = state.get('ics_task')
+
+    if not termine:
+        logger.error("[Chat] Calendar YES: No raw data found in state")
+        return _reply(turn, "Fehler: Keine Termine verfügbar. Bitte erneut anfragen.")
+
+    _calendar_accepted[turn.username] = True
+    try:
+        logger.info("[Chat] Calendar YES - using raw data (%s chars)", len(termine))
+        ics_content = None
+        if ics_task is not None:
+            # Usually already finished while the user was reading the answer
+            try:
+                ics_content = await asyncio.wait_for(ics_task, timeout=ICS_PREBUILD_TIMEOUT_SECONDS)
+            except Exception as e:
+                logger.warning("[Chat] Prebuilt calendar entries unavailable (%r) - generating them now", e)
+        if ics_content is None:
+            ics_content = await _calendar_entries(termine, turn.api_key)
+
+        # Extract events from ICS for suggested_events
+        suggested_events = extract_events_from_ics(ics_content)
+
+        logger.info("[Chat] Calendar YES - extracted %s events", len(suggested_events))
+
+        # Return only the suggested events as buttons, no ICS file download
+        result = _build_chat_response("", turn.username, suggested_events=suggested_events)
+        end_turn(turn.timer, bot_message=f"suggested_events returned ({len(suggested_events)} events)", intent=turn.intent)
+        return result
+
+    except Exception as e:
+        logger.error("[Chat] Calendar entry creation failed: %s", e)
+        return _reply(turn, f"Fehler beim Erstellen der Kalender-Einträge: {e}")
+
+
+async def _chat_calendar_no(turn: _ChatTurn):
+    # clear awaiting flag for this user and drop the prebuilt calendar entries
+    ics_task = (_pop_state(turn.username) or {}).get('ics_task')
+    if ics_task is not None:
+        ics_task.cancel()
+    _calendar_accepted.pop(turn.username, None)
+    return _reply_constant(turn, CALENDAR_NO_MSG, _CALENDAR_NO_RESPONSE)
+
+
+async def _chat_unknown(turn: _ChatTurn):
+    emotion_response, emotion_category = turn.emotion_response, turn.emotion_category
+    # Wenn eine Gefühlsäußerung erkannt wurde, aber kein spezifischer Intent
+    if emotion_response:
+        # Prüfe, ob die Nachricht auch eine Frage/Anfrage enthält
+        msg_low = turn.request.message.lower()
+        if any(kw in msg_low for kw in _HELP_REQUEST_KEYWORDS):
+            if any(kw in msg_low for kw in _EXAM_TOPIC_KEYWORDS):
+                # Kombination aus Gefühl + Klausurvorbereitung-Anfrage
+                combined_msg = " ".join((emotion_response, EMOTION_HELP_WIZARD_MSG))
+            else:
+                # Allgemeine Hilfe-Anfrage
+                combined_msg = " ".join((emotion_response, EMOTION_HELP_GENERIC_MSG))
+            end_turn(turn.timer, bot_message=combined_msg, intent=f"{emotion_category}_with_help")
+            return _build_chat_response(combined_msg, turn.username)
+        # Nur Gefühlsäußerung, keine konkrete Anfrage
+        msg = " ".join((emotion_response, EMOTION_ONLY_MSG))
+        end_turn(turn.timer, bot_message=msg, intent=emotion_category)
+        return _build_chat_response(msg, turn.username)
+
+    # Keine Gefühlsäußerung und kein Intent erkannt
+    return _reply_constant(turn, NOT_UNDERSTOOD_MSG, _NOT_UNDERSTOOD_RESPONSE)
+
+
+_CALENDAR_NO_RESPONSE = _constant_chat_response(CALENDAR_NO_MSG)
+_NOT_UNDERSTOOD_RESPONSE = _constant_chat_response(NOT_UNDERSTOOD_MSG)
+
+# Intent -> handler; anything not listed (including 'unknown') goes to _chat_unknown
+INTENT_HANDLERS = {
+    "start_exam_wizard": _chat_start_exam_wizard,
+    "stop_exam_wizard": _chat_stop_exam_wizard,
+    "get_moodle_appointments": _chat_moodle_appointments,
+    "get_stine_messages": _static_reply_handler(STINE_MESSAGES_MSG),
+    "get_stine_exams": _chat_stine_exams,
+    "get_all_appointments": _chat_all_appointments,
+    "get_mail": _static_reply_handler(MAIL_MSG),
+    "settings": _chat_settings,
+    "greeting": _static_reply_handler(GREETING_MSG),
+    "help": _static_reply_handler(HELP_MSG),
+    "calendar_yes": _chat_calendar_yes,
+    "calendar_no": _chat_calendar_no,
+}
+# Intents that keep (or start/stop) the exam wizard instead of interrupting it
+_WIZARD_INTENTS = frozenset(("start_exam_wizard", "stop_exam_wizard"))
 
 
 @app.post("/chat")
 async def chat(request: ChatRequest):
-    global latestMessage
-    latestMessage = request.message
-
     # === EVAL LOG START (Turn beginnt sobald Message im Backend ankommt) ===
     timer = start_turn(username=request.username, conv_id=request.conv_id, user_message=request.message)
 
@@ -551,49 +1323,37 @@ async def chat(request: ChatRequest):
         return _build_chat_response(msg, username)
 
 
-    # Check and expire any old conversation state for this user
-    with state_lock:
-        state = conversation_state.get(username)
-        if state:
-            if time.time() - state.get('ts', 0) > STATE_EXPIRY_SECONDS:
-                # expired
-                del conversation_state[username]
-                state = None
+    # Snapshot the fields we branch on (expired state is already gone from the TTL cache)
+    # so the rest of the turn works on locals instead of repeated dict lookups
+    state = _get_state(username)
+    wizard_state, awaiting_calendar, configuring_settings, settings_step, reminder_days_tasks = (
+        (state or {}).get(k)
+        for k in ('wizard', 'awaiting_calendar', 'configuring_settings', 'settings_step', 'reminder_days_tasks')
+    )
 
-    wizard_state = state.get('wizard') if state else None
     wizard_active = bool(wizard_state and wizard_state.get('active'))
     msg_low = request.message.strip().lower()
     stop_keywords = ("exit")
 
-    # ================================================================
-    # Emotional Response Detection
-    # ================================================================
-    # Erkenne Gefühlsäußerungen BEVOR Intent-Detection läuft
-    emotion_category, emotion_response = detect_emotion(request.message)
-    
     # Allow global exit to cancel the wizard if it's active
     if wizard_active and msg_low.strip() == "exit":
-        with state_lock:
-            user_state = conversation_state.get(username, {})
-            user_state.pop('wizard', None)
-            user_state['ts'] = time.time()
-            conversation_state[username] = user_state
-        end_turn(timer, bot_message="Wizard beendet. Sag Bescheid, wenn ich wieder helfen soll.", intent="stop_exam_wizard")
-        return _build_chat_response("Wizard beendet. Sag Bescheid, wenn ich wieder helfen soll.", username, is_wizard_message=True)
+        _clear_wizard(username)
+        end_turn(timer, bot_message=WIZARD_ENDED_MSG, intent="stop_exam_wizard")
+        return _build_chat_response(WIZARD_ENDED_MSG, username, is_wizard_message=True)
 
     # If the bot previously asked about adding to calendar, interpret simple yes/no locally
     intent = None
-    if state and state.get('awaiting_calendar'):
+    if awaiting_calendar:
         # Interpret a short affirmative/negative reply without calling ChatGPT
-        if msg_low in ("ja", "j", "yes", "y", "klar", "gerne"):
+        if msg_low in _AFFIRMATIVE_REPLIES:
             intent = "calendar_yes"
-        elif msg_low in ("nein", "n", "no"):
+        elif msg_low in _NEGATIVE_REPLIES:
             intent = "calendar_no"
         # If message isn't a clear yes/no, fall back to full intent detection (below)
     
     # If the bot is in settings configuration mode, handle settings dialog
-    elif state and state.get('configuring_settings'):
-        step = state.get('settings_step', 'ask_task_days')
+    elif configuring_settings:
+        step = settings_step or 'ask_task_days'
         msg = request.message.strip()
         
         if step == 'ask_task_days':
@@ -607,10 +1367,10 @@ async def chat(request: ChatRequest):
 
                 
                 # Save to state and ask next question
-                with state_lock:
-                    conversation_state[username]['reminder_days_tasks'] = days
-                    conversation_state[username]['settings_step'] = 'ask_exam_days'
-                    conversation_state[username]['ts'] = time.time()
+                with _state_lock(username):
+                    user_state = _get_state(username) or {'configuring_settings': True}
+                    user_state.update(reminder_days_tasks=days, settings_step='ask_exam_days')
+                    _set_state(username, user_state)
                 
                 msg = f"Gut, ich erinnere dich {days} Tag(e) vor Aufgaben-Deadlines.\n\nWie viele Tage vor einer Klausur möchtest du erinnert werden? (z.B. 7 für eine Woche vorher)"
                 end_turn(timer, bot_message=msg, intent="settings")
@@ -633,11 +1393,9 @@ async def chat(request: ChatRequest):
 
                 
                 # Save settings and clear state
-                task_days = state.get('reminder_days_tasks', 1)
+                task_days = reminder_days_tasks if reminder_days_tasks is not None else 1
                 
-                with state_lock:
-                    if username in conversation_state:
-                        del conversation_state[username]
+                _pop_state(username)
                 
                 # Return settings to frontend for storage
                 msg = f"Alles klar! Deine Erinnerungseinstellungen wurden gespeichert:\n- Aufgaben: {task_days} Tag(e) vorher\n- Klausuren: {days} Tag(e) vorher\n\nIch werde dich entsprechend benachrichtigen!"
@@ -651,9 +1409,7 @@ async def chat(request: ChatRequest):
 
         
         # Fallback: should not reach here
-        with state_lock:
-            if username in conversation_state:
-                del conversation_state[username]
+        _pop_state(username)
         msg = "Ein Fehler ist aufgetreten. Bitte versuche es erneut."
         end_turn(timer, bot_message=msg, intent="settings")
         return _build_chat_response(msg, username, is_settings_message=True)
@@ -662,46 +1418,38 @@ async def chat(request: ChatRequest):
     # While wizard is active: skip intent detection; only allow explicit stop keyword
     if wizard_active:
         if any(msg_low.strip() == kw for kw in stop_keywords):
-            with state_lock:
-                user_state = conversation_state.get(username, {})
-                user_state.pop('wizard', None)
-                user_state['ts'] = time.time()
-                conversation_state[username] = user_state
-            return _build_chat_response("Wizard beendet. Sag Bescheid, wenn ich wieder helfen soll.", username, is_wizard_message=True)
-
-        wizard_response = _handle_wizard_message(username, request.message, state, api_key)
+            _clear_wizard(username)
+            return _build_chat_response(WIZARD_ENDED_MSG, username, is_wizard_message=True)
+
+        wizard_response = await asyncio.to_thread(_handle_wizard_message, username, request.message, state, api_key)
         if wizard_response:
             return _build_chat_response(wizard_response, username, is_wizard_message=True)
         # If wizard handler could not process, keep user in wizard and prompt to continue or stop
         return _build_chat_response("Ich bin im Klausur-Wizard. Bitte beantworte die letzte Frage oder schreibe 'wizard beenden' zum Abbrechen.", username, is_wizard_message=True)
 
-    # Quick keywords for starting the wizard without LLM
+    # Fast keyword-based intent detection to avoid unnecessary LLM calls
     if intent is None:
-        if any(kw in msg_low for kw in ["klausurvorbereitung", "exam wizard", "wizard starten"]):
+        intent = _KEYWORD_INTENTS.get(msg_low)
+        if intent is None and any(kw in msg_low for kw in _WIZARD_TRIGGERS):
             intent = "start_exam_wizard"
+        elif intent is None and msg_low in _YES_NO_REPLIES:
+            # A bare yes/no without a pending calendar question confirms nothing; the LLM would
+            # label it calendar_yes/no, which is discarded below anyway
+            intent = "unknown"
+        if intent == "start_exam_wizard":
             wizard_active = True
 
-    # Fast keyword-based intent detection to avoid unnecessary LLM calls
-    if intent is None:
-        # Check for settings/reminders
-        if any(msg_low.strip() == kw for kw in ["settings", "/settings", "einstellungen", "erinnerungseinstellungen"]):
-            intent = "settings"
-        # Check for common Moodle-related keywords
-        elif msg_low == "/moodle":
-            intent = "get_moodle_appointments"
-        # Check for Stine exam keywords
-        elif msg_low in ["/exams", "/stine"]:
-            intent = "get_stine_exams"
-        # Check for mail keywords
-        elif msg_low == "/mail":
-            intent = "get_mail"
-        # Check for help
-        elif msg_low in ["hilfe", "/help"]:
-            intent = "help"
+    if _FORCE_REFRESH_RE.search(msg_low):
+        invalidate_scraped_data(username)
 
     # If no keyword match, use LLM for intent detection
+    moodle_prefetch = None
     if intent is None:
-        intent = await determine_intent(request.message, api_key)
+        # Overlap the (slow) Moodle scrape with intent detection when the message hints at Moodle
+        if (request.username and request.password and _MOODLE_HINT_RE.search(msg_low)
+                and get_cached_scraped_data(username, 'moodle')[0] is None):
+            moodle_prefetch = _prefetch_moodle(request.username, request.password)
+        intent = await determine_intent(request.message, api_key, bool(awaiting_calendar))
     else:
         # If we already set intent based on local short-reply parsing, keep it.
         pass
@@ -709,269 +1457,45 @@ async def chat(request: ChatRequest):
     # Safety: if ChatGPT returned calendar_yes/calendar_no but we did not previously ask the
     # calendar question for this user, ignore those labels to avoid accidental triggers.
     if intent in ("calendar_yes", "calendar_no"):
-        if not (state and state.get('awaiting_calendar')):
+        if not awaiting_calendar:
             # Treat as unknown so normal routing/keyword checks apply.
             intent = "unknown"
     
-    logging.info(f"[Chat] Detected intent: {intent}")
-    logging.info(f"[Chat] Username: {username}")
-    logging.info(f"[Chat] Has password: {bool(request.password)}")
-    
-    # Route based on detected intent
-    if intent == "start_exam_wizard":
-        base_state = state or {}
-        wizard = _new_wizard_state()
-        with state_lock:
-            conversation_state[username] = {**base_state, 'wizard': wizard, 'ts': time.time()}
-        response_msg = ("Gern helfe ich dir bei der Klausurvorbereitung.\n\n"
-                 " Du kannst den Vorbereitungs-Wizard jederzeit mit 'exit' abbrechen.\n\n"
-                 " Damit ich dir helfen kann, muss ich dir zunächst ein paar Fragen stellen.\n"
-                 " 1. Um welches Modul geht es?")
-        return _build_chat_response(response_msg, username, is_wizard_message=True)
-
-    elif intent == "stop_exam_wizard":
-        with state_lock:
-            if username in conversation_state:
-                conversation_state[username].pop('wizard', None)
-                if not conversation_state[username]:
-                    del conversation_state[username]
-        end_turn(timer, bot_message="Wizard beendet. Sag Bescheid, wenn ich wieder helfen soll.", intent="stop_exam_wizard")
-        return _build_chat_response("Wizard beendet. Sag Bescheid, wenn ich wieder helfen soll.", username, is_wizard_message=True)
+    logger.info("[Chat] Detected intent: %s | Username: %s | Has password: %s", intent, username, bool(request.password))
 
+    # ================================================================
+    # Emotional Response Detection
+    # ================================================================
+    # Erkenne Gefühlsäußerungen nur für Intents, deren Antwort sie verwenden
+    if intent in _NO_EMOTION_INTENTS:
+        emotion_category, emotion_response = None, None
+    else:
+        emotion_category, emotion_response = detect_emotion(request.message)
+    
     # Any other intent while wizard is active: reset wizard and process the intent normally
-    if wizard_active and intent not in ("start_exam_wizard", "stop_exam_wizard"):
-        logging.info(f"[Chat] Wizard interrupted by intent '{intent}' - resetting wizard")
-        with state_lock:
-            if username in conversation_state:
-                conversation_state[username].pop('wizard', None)
-                if not conversation_state[username]:
-                    del conversation_state[username]
-        # Continue processing the intent below
-
-    if intent == "get_moodle_appointments":
-        # Wenn Gefühlsäußerung erkannt wurde, füge empathische Antwort hinzu
-        emotion_prefix = ""
-        if emotion_response:
-            emotion_prefix = f"{emotion_response} "
-            logging.info(f"[Chat] Adding emotional response to Moodle request: {emotion_category}")
-        
-        logging.info("[Chat] Processing Moodle appointments request")
-        try:
-            # Check cache first for scraped data
-            cached_data, _ = get_cached_scraped_data(username, 'moodle')
-            if cached_data:
-                logging.info("[Chat] Using cached Moodle raw data; regenerating response for current query")
-                termine = cached_data
-            else:
-                # Cache miss - scrape and cache the data
-                logging.info("[Chat] Cache miss - starting Moodle scraper")
-                logging.info(f"[Chat] Username for scraper: {request.username}")
-                termine = scrape_moodle_text(request.username, request.password)
-                logging.info(f"[Chat] Scraper returned {len(termine)} characters")
-                
-                # Check if scraper returned an error
-                if any(error_keyword in termine for error_keyword in ["Fehler", "nicht verfügbar", "Selenium", "WebDriver", "Chrome", "Failed", "Exception"]):
-                    logging.warning(f"[Chat] Scraper returned error: {termine[:100]}")
-                    msg = "Moodle ist gerade nicht erreichbar. Bitte versuche es später noch einmal."
-                    end_turn(timer, bot_message=msg, intent=intent)
-                    return _build_chat_response(msg, username)
-
-                # Cache raw data only
-                cache_scraped_data(username, 'moodle', termine)
-
-            # Always regenerate the ChatGPT answer so user constraints in the latest message are applied
-            logging.info("[Chat] Asking ChatGPT to format Moodle data for current query")
-            response = ask_chatgpt_moodle(termine, api_key)
-            
-            # Füge empathische Antwort vor die eigentliche Antwort
-            if emotion_prefix:
-                response = emotion_prefix + response
-            
-            logging.info(f"[Chat] ChatGPT response length: {len(response)}")
-            
-            # If ChatGPT asked whether to add events to calendar, mark state so the next short reply
-            # can be interpreted as consent/denial. We only set this for the requesting user.
-            if response and "Soll ich dir die Termine auch in deinen Kalender eintragen?" in response:
-                with state_lock:
-                    # IMPORTANT: Store RAW scraper data, not formatted response
-                    conversation_state[username] = { 'awaiting_calendar': True, 'raw_termine': termine, 'ts': time.time() }
-                logging.info("[Chat] Calendar option offered - raw data stored in state")
-            end_turn(timer, bot_message=response, intent=intent)
-            return _build_chat_response(response, username)
-
-        except Exception as e:
-            response = f"Fehler beim Abrufen: {e}"
-            end_turn(timer, bot_message=response, intent=intent)
-            return _build_chat_response(response, username)
-
-    elif intent == "get_stine_messages":
-        msg = "Die Funktion zum Abrufen von Stine-Nachrichten ist noch nicht implementiert."
-        end_turn(timer, bot_message=msg, intent=intent)
-        return _build_chat_response(msg, username)
-
-    elif intent == "get_stine_exams":
-        # Wenn Gefühlsäußerung erkannt wurde, füge empathische Antwort hinzu
-        emotion_prefix = ""
-        if emotion_response:
-            emotion_prefix = f"{emotion_response} "
-            logging.info(f"[Chat] Adding emotional response to STINE request: {emotion_category}")
-        
-        try:
-            # Check cache first for scraped data
-            cached_data, _ = get_cached_scraped_data(username, 'stine_exams')
-            if cached_data:
-                logging.info("[Chat] Using cached STINE raw data; regenerating response for current query")
-                exams_text = cached_data
-            else:
-                # Cache miss - scrape and cache the data
-                exams_text = scrape_stine_exams(request.username, request.password)
-                
-                # Check if scraper returned an error
-                if any(error_keyword in exams_text for error_keyword in ["Fehler", "nicht verfügbar", "Selenium", "WebDriver", "Chrome", "Failed", "Exception"]):
-                    logging.warning(f"[Chat] STINE scraper returned error: {exams_text[:100]}")
-                    msg = "STINE ist gerade nicht erreichbar. Bitte versuche es später noch einmal."
-                    end_turn(timer, bot_message=msg, intent=intent)
-                    return _build_chat_response(msg, username)
-
-                # Cache raw data only
-                cache_scraped_data(username, 'stine_exams', exams_text)
-
-            # Always regenerate the ChatGPT answer so user constraints in the latest message are applied
-            response = ask_chatgpt_exams(exams_text, api_key)
-            
-            # Füge empathische Antwort vor die eigentliche Antwort
-            if emotion_prefix:
-                response = emotion_prefix + response
-            
-            # If ChatGPT asked whether to add events to calendar, mark state so the next short reply
-            # can be interpreted as consent/denial. We only set this for the requesting user.
-            if response and "Soll ich dir die Termine auch in deinen Kalender eintragen?" in response:
-                with state_lock:
-                    # IMPORTANT: Store RAW scraper data, not formatted response
-                    conversation_state[username] = { 'awaiting_calendar': True, 'raw_termine': exams_text, 'ts': time.time() }
-                logging.info("[Chat] Calendar option offered for STINE exams - raw data stored in state")
-            end_turn(timer, bot_message=response, intent=intent)
-            return _build_chat_response(response, username)
-
-        except Exception as e:
-            response = f"Fehler beim Abrufen der Stine-Prüfungen: {e}"
-            end_turn(timer, bot_message=response, intent=intent)
-            return _build_chat_response(response, username)
-
-    elif intent == "get_mail":
-        msg = "Die Funktion zum Abrufen von E-Mails ist noch nicht implementiert."
-        end_turn(timer, bot_message=msg, intent=intent)
-        return _build_chat_response(msg, username)
-
-    elif intent == "settings":
-        # Start settings configuration dialog
-        with state_lock:
-            conversation_state[username] = {
-                'configuring_settings': True,
-                'settings_step': 'ask_task_days',
-                'ts': time.time()
-            }
-        msg = "**Lass uns deine Erinnerungseinstellungen konfigurieren!** \n\nWie viele Tage vor einer Aufgaben-Deadline möchtest du erinnert werden? (z.B. 1 für einen Tag vorher, 3 für drei Tage vorher)"
-        end_turn(timer, bot_message=msg, intent=intent)
-        return _build_chat_response(msg, username, is_settings_message=True)
-
-    elif intent == "greeting":
-        msg = "Hallo! Wie kann ich dir helfen?"
-        end_turn(timer, bot_message=msg, intent=intent)
-        return _build_chat_response(msg, username)
-
-    elif intent == "help":
-        msg = "Ich kann dir bei folgenden Dingen helfen:\n\n" \
-                         "- Moodle-Termine und Deadlines abrufen\n" \
-                         "- Stine-Prüfungstermine abrufen\n" \
-                         "- Erinnerungseinstellungen konfigurieren\n" \
-                         "- Kalendertermine hinzufügen\n" \
-                         " - dich bei der Klausurvorbereitung unterstützen\n\n"
-        end_turn(timer, bot_message=msg, intent=intent)
-        return _build_chat_response(msg, username)
-
-    elif intent == "calendar_yes":
-        # proceed to create calendar entries
-        termine = None
-        with state_lock:
-            if username in conversation_state:
-                state = conversation_state[username]
-                # Get the RAW data (not formatted response)
-                termine = state.get('raw_termine', '')
-                del conversation_state[username]
-        
-        if not termine:
-            logging.error("[Chat] Calendar YES: No raw data found in state")
-            msg = "Fehler: Keine Termine verfügbar. Bitte erneut anfragen."
-            end_turn(timer, bot_message=msg, intent=intent)
-            return _build_chat_response(msg, username)
-
-        
-        try:
-            logging.info(f"[Chat] Calendar YES - using raw data ({len(termine)} chars)")
-            _, ics_content = make_calendar_entries(termine, api_key)
-            
-            # Extract events from ICS for suggested_events
-            suggested_events = extract_events_from_ics(ics_content)
-            
-            logging.info(f"[Chat] Calendar YES - extracted {len(suggested_events)} events")
-            
-            # Return only the suggested events as buttons, no ICS file download
-            result = _build_chat_response("", username, suggested_events=suggested_events)
-            end_turn(timer, bot_message=f"suggested_events returned ({len(suggested_events)} events)", intent=intent)
-            return result
-
-        except Exception as e:
-            response = f"Fehler beim Erstellen der Kalender-Einträge: {e}"
-            logging.error(f"[Chat] Calendar entry creation failed: {e}")
-            end_turn(timer, bot_message=response, intent=intent)
-            return _build_chat_response(response, username)
-
-    elif intent == "calendar_no":
-        # clear awaiting flag for this user
-        with state_lock:
-            if username in conversation_state:
-                del conversation_state[username]
-        msg = "Alles klar. Mit was kann ich dir sonst helfen?"
-        end_turn(timer, bot_message=msg, intent=intent)
-        return _build_chat_response(msg, username)
+    if wizard_active and intent not in _WIZARD_INTENTS:
+        logger.info("[Chat] Wizard interrupted by intent '%s' - resetting wizard", intent)
+        _clear_wizard(username)
 
-    else:
-        # Wenn eine Gefühlsäußerung erkannt wurde, aber kein spezifischer Intent
-        if emotion_response:
-            # Prüfe, ob die Nachricht auch eine Frage/Anfrage enthält
-            help_keywords = ['hilfe', 'helfen', 'unterstützen', 'kannst du', 'könntest du', 'würdest du']
-            wizard_keywords = ['klausur', 'prüfung', 'vorbereitung', 'lernen', 'thema']
-            
-            if any(kw in msg_low for kw in help_keywords):
-                if any(kw in msg_low for kw in wizard_keywords):
-                    # Kombination aus Gefühl + Klausurvorbereitung-Anfrage
-                    combined_msg = f"{emotion_response} Ich kann dir bei der Klausurvorbereitung helfen! Möchtest du den Klausur-Wizard starten? (Schreibe 'Klausurvorbereitung' oder 'Hilfe' für mehr Optionen)"
-                else:
-                    # Allgemeine Hilfe-Anfrage
-                    combined_msg = f"{emotion_response} Ich kann dir bei verschiedenen Dingen helfen:\n\n" \
-                                 "- Moodle-Termine und Deadlines abrufen\n" \
-                                 "- Stine-Prüfungstermine abrufen\n" \
-                                 "- Klausurvorbereitung\n" \
-                                 "- Kalendertermine hinzufügen\n\n" \
-                                 "Was kann ich für dich tun?"
-                end_turn(timer, bot_message=combined_msg, intent=f"{emotion_category}_with_help")
-                return _build_chat_response(combined_msg, username)
-            else:
-                # Nur Gefühlsäußerung, keine konkrete Anfrage
-                msg = f"{emotion_response} Wie kann ich dir noch helfen?"
-                end_turn(timer, bot_message=msg, intent=emotion_category)
-                return _build_chat_response(msg, username)
-        
-        # Keine Gefühlsäußerung und kein Intent erkannt
-        msg = "Entschuldigung, ich habe dich nicht verstanden. Du erhälst eine Auflistung meiner Funktionen, wenn du 'Hilfe' schreibst."
-        end_turn(timer, bot_message=msg, intent=intent)
-        return _build_chat_response(msg, username)
+    # Route based on detected intent
+    turn = _ChatTurn(
+        request=request, username=username, api_key=api_key, intent=intent, timer=timer,
+        state=state, emotion_category=emotion_category,
+        emotion_response=emotion_response, moodle_prefetch=moodle_prefetch,
+    )
+    return await INTENT_HANDLERS.get(intent, _chat_unknown)(turn)
 
 
-@app.get("/health")
-def health():
-    return {"status": "ok"}
+# Probe/diagnostics endpoints stay out of the generated OpenAPI schema
+@app.get("/health", include_in_schema=False)
+async def health():
+    return {
+        "status": "ok",
+        "cache": {
+            "emotion": _classify_emotion.cache_info()._asdict(),
+            "intent": intent_cache_info(),
+        },
+    }
 
 
 # ============================================================================
@@ -979,33 +1503,32 @@ def health():
 # ============================================================================
 
 @app.post("/credentials/save")
-def api_save_credentials(req: CredentialsSaveRequest):
+async def api_save_credentials(req: CredentialsSaveRequest):
     """Save encrypted credentials to local device storage."""
-    success = save_credentials(req.username, req.password, req.api_key)
+    success = await asyncio.to_thread(save_credentials, req.username, req.password, req.api_key)
     if success:
         return {"success": True, "message": "Credentials saved successfully"}
     else:
         return {"success": False, "message": "Failed to save credentials"}
 
 
-@app.get("/credentials/load")
-def api_load_credentials() -> CredentialsResponse:
+# CredentialsResponse only documents the schema; the plain dict goes straight to orjson
+# without a response-model validation pass
+@app.get("/credentials/load", responses={200: {"model": CredentialsResponse}})
+async def api_load_credentials():
     """Load encrypted credentials from local device storage."""
-    creds = load_credentials()
-    if creds:
-        return CredentialsResponse(
-            username=creds.get("username"),
-            password=creds.get("password"),
-            api_key=creds.get("api_key")
-        )
-    else:
-        return CredentialsResponse()
+    creds = await asyncio.to_thread(load_credentials) or {}
+    return {
+        "username": creds.get("username"),
+        "password": creds.get("password"),
+        "api_key": creds.get("api_key"),
+    }
 
 
 @app.delete("/credentials/delete")
-def api_delete_credentials():
+async def api_delete_credentials():
     """Delete stored credentials from local device storage."""
-    success = delete_credentials()
+    success = await asyncio.to_thread(delete_credentials)
     if success:
         return {"success": True, "message": "Credentials deleted successfully"}
     else:
@@ -1017,38 +1540,29 @@ def api_delete_credentials():
 # ============================================================================
 
 @app.post("/api/google/oauth/callback")
-async def google_oauth_callback(data: dict):
+async def google_oauth_callback(req: OAuthCallbackRequest, request: Request):
     """
     Handle OAuth callback - exchange authorization code for tokens
     """
-    logging.info(f"OAuth callback received with data keys: {list(data.keys())}")
-    
-    code = data.get("code")
-    redirect_uri = data.get("redirect_uri")
-    
-    if not code or not redirect_uri:
-        logging.error(f"Missing code or redirect_uri. Code present: {bool(code)}, redirect_uri: {redirect_uri}")
-        return {"success": False, "message": "Missing code or redirect_uri"}
-    
-    logging.info(f"Exchanging authorization code for tokens...")
+    logger.info("Exchanging authorization code for tokens...")
     # Exchange code for tokens
-    token_data = exchange_code_for_token(code, redirect_uri)
+    token_data = await exchange_code_for_token(request.app.state.http, req.code, req.redirect_uri)
     
     if not token_data:
         error_msg = "Failed to exchange code for token - check backend logs for Google API response"
-        logging.error(error_msg)
+        logger.error(error_msg)
         return {"success": False, "message": error_msg, "debug": "Check server logs"}
     
-    logging.info("Successfully exchanged code for tokens, fetching user info...")
+    logger.info("Successfully exchanged code for tokens, fetching user info...")
     # Fetch user info
     access_token = token_data.get("access_token")
-    user_info = get_user_info(access_token)
+    user_info = await get_user_info(request.app.state.http, access_token)
     
     if not user_info:
-        logging.error("Failed to fetch user info")
+        logger.error("Failed to fetch user info")
         return {"success": False, "message": "Failed to fetch user info"}
     
-    logging.info(f"Successfully authenticated user: {user_info.get('email')}")
+    logger.info("Successfully authenticated user: %s", user_info.get('email'))
     return {
         "success": True,
         "access_token": access_token,
@@ -1063,22 +1577,13 @@ async def google_oauth_callback(data: dict):
 
 
 @app.post("/api/google/calendar/events")
-async def get_calendar_events(data: dict):
+async def get_calendar_events(req: CalendarEventsRequest, request: Request):
     """
     Fetch Google Calendar events for a given time range
     """
-    logging.info("Calendar events endpoint called")
-    access_token = data.get("access_token")
-    time_min = data.get("time_min")
-    time_max = data.get("time_max")
-    
-    if not access_token:
-        logging.error("Missing access_token in calendar events request")
-        return {"success": False, "message": "Missing access_token"}
-    
-    logging.info(f"Fetching calendar events from {time_min} to {time_max}")
-    events = fetch_calendar_events(access_token, time_min, time_max)
-    logging.info(f"Retrieved {len(events)} calendar events")
+    logger.info("Fetching calendar events from %s to %s", req.time_min, req.time_max)
+    events = await fetch_calendar_events(request.app.state.http, req.access_token, req.time_min, req.time_max)
+    logger.info("Retrieved %s calendar events", len(events))
     
     return {
         "success": True,
@@ -1087,16 +1592,11 @@ async def get_calendar_events(data: dict):
 
 
 @app.post("/api/google/oauth/refresh")
-async def refresh_token_endpoint(data: dict):
+async def refresh_token_endpoint(req: RefreshTokenRequest, request: Request):
     """
     Refresh access token using refresh token
     """
-    refresh_token = data.get("refresh_token")
-    
-    if not refresh_token:
-        return {"success": False, "message": "Missing refresh_token"}
-    
-    token_data = refresh_access_token(refresh_token)
+    token_data = await refresh_access_token(request.app.state.http, req.refresh_token)
     
     if not token_data:
         return {"success": False, "message": "Failed to refresh token"}
@@ -1109,33 +1609,21 @@ async def refresh_token_endpoint(data: dict):
 
 
 @app.post("/api/google/calendar/create")
-async def create_calendar_event_endpoint(data: dict):
+async def create_calendar_event_endpoint(req: CreateEventRequest, request: Request):
     """
     Create an event in Google Calendar
     """
-    logging.info("Create calendar event endpoint called")
-    logging.info(f"Received data: {data}")
-    
-    access_token = data.get("access_token")
-    event_title = data.get("title")
-    event_date = data.get("date")
-    
-    logging.info(f"access_token present: {bool(access_token)}")
-    logging.info(f"title: {event_title}")
-    logging.info(f"date: {event_date}")
+    event_title = req.title
+    event_date = req.date
     
-    if not access_token or not event_title or not event_date:
-        logging.error(f"Missing required fields. access_token: {bool(access_token)}, title: {bool(event_title)}, date: {bool(event_date)}")
-        return {"success": False, "message": "Missing access_token, title, or date"}
-    
-    logging.info(f"Creating event: {event_title} on {event_date}")
-    created_event = create_calendar_event(access_token, event_title, event_date)
+    logger.info("Creating event: %s on %s", event_title, event_date)
+    created_event = await create_calendar_event(request.app.state.http, req.access_token, event_title, event_date)
     
     if not created_event:
-        logging.error("Failed to create calendar event")
+        logger.error("Failed to create calendar event")
         return {"success": False, "message": "Failed to create event in Google Calendar"}
     
-    logging.info(f"Event created successfully: {created_event.get('id')}")
+    logger.info("Event created successfully: %s", created_event.get('id'))
     
     return {
         "success": True,
@@ -1149,32 +1637,60 @@ async def create_calendar_event_endpoint(data: dict):
     }
 
 
+@app.post("/api/google/calendar/create_batch")
+async def create_calendar_events_batch_endpoint(req: BatchEventRequest, request: Request):
+    """
+    Create several events in Google Calendar at once (requests run concurrently)
+    """
+    logger.info("Batch create endpoint called with %d events", len(req.events))
+
+    async def _create(evt):
+        async with _google_create_semaphore:
+            return await create_calendar_event(request.app.state.http, req.access_token, evt.title, evt.date)
+
+    created_events = await asyncio.gather(*(_create(evt) for evt in req.events), return_exceptions=True)
+
+    results = []
+    for evt, created in zip(req.events, created_events):
+        if isinstance(created, BaseException) or not created:
+            logger.error("Failed to create calendar event: %s on %s (%s)", evt.title, evt.date, created)
+            results.append({"success": False, "message": "Failed to create event in Google Calendar"})
+            continue
+        results.append({
+            "success": True,
+            "event_id": created.get("id"),
+            "event": {
+                "id": f"google-{created.get('id')}",
+                "date": evt.date,
+                "text": evt.title,
+                "source": "google"
+            }
+        })
+
+    created_count = sum(1 for r in results if r["success"])
+    logger.info("Batch create finished: %d/%d events created", created_count, len(results))
+    return {"success": created_count > 0, "created": created_count, "results": results}
+
+
 @app.post("/api/google/calendar/delete")
-async def delete_calendar_event_endpoint(data: dict):
+async def delete_calendar_event_endpoint(req: DeleteEventRequest, request: Request):
     """
     Delete an event from Google Calendar
     """
-    logging.info("Delete calendar event endpoint called")
-    
-    access_token = data.get("access_token")
-    event_id = data.get("event_id")
-    
-    if not access_token or not event_id:
-        logging.error(f"Missing required fields. access_token: {bool(access_token)}, event_id: {bool(event_id)}")
-        return {"success": False, "message": "Missing access_token or event_id"}
+    event_id = req.event_id
     
     # Remove 'google-' prefix if present
     if event_id.startswith("google-"):
         event_id = event_id[7:]
     
-    logging.info(f"Deleting event: {event_id}")
-    success = delete_calendar_event(access_token, event_id)
+    logger.info("Deleting event: %s", event_id)
+    success = await delete_calendar_event(request.app.state.http, req.access_token, event_id)
     
     if not success:
-        logging.error("Failed to delete calendar event")
+        logger.error("Failed to delete calendar event")
         return {"success": False, "message": "Failed to delete event from Google Calendar"}
     
-    logging.info(f"Event deleted successfully: {event_id}")
+    logger.info("Event deleted successfully: %s", event_id)
     
     return {
         "success": True,
@@ -1183,33 +1699,26 @@ async def delete_calendar_event_endpoint(data: dict):
 
 
 @app.post("/api/google/calendar/update")
-async def update_calendar_event_endpoint(data: dict):
+async def update_calendar_event_endpoint(req: UpdateEventRequest, request: Request):
     """
     Update an event in Google Calendar
     """
-    logging.info("Update calendar event endpoint called")
-    
-    access_token = data.get("access_token")
-    event_id = data.get("event_id")
-    event_title = data.get("title")
-    event_date = data.get("date")
-    
-    if not access_token or not event_id or not event_title or not event_date:
-        logging.error(f"Missing required fields. access_token: {bool(access_token)}, event_id: {bool(event_id)}, title: {bool(event_title)}, date: {bool(event_date)}")
-        return {"success": False, "message": "Missing access_token, event_id, title, or date"}
+    event_id = req.event_id
+    event_title = req.title
+    event_date = req.date
     
     # Remove 'google-' prefix if present
     if event_id.startswith("google-"):
         event_id = event_id[7:]
     
-    logging.info(f"Updating event: {event_id}")
-    updated_event = update_calendar_event(access_token, event_id, event_title, event_date)
+    logger.info("Updating event: %s", event_id)
+    updated_event = await update_calendar_event(request.app.state.http, req.access_token, event_id, event_title, event_date)
     
     if not updated_event:
-        logging.error("Failed to update calendar event")
+        logger.error("Failed to update calendar event")
         return {"success": False, "message": "Failed to update event in Google Calendar"}
     
-    logging.info(f"Event updated successfully: {event_id}")
+    logger.info("Event updated successfully: %s", event_id)
     
     return {
         "success": True,
@@ -1225,32 +1734,28 @@ async def update_calendar_event_endpoint(data: dict):
 
 
 @app.get("/", response_class=HTMLResponse)
-def root():
-    if FRONTEND_DIST:
-        index_path = os.path.join(FRONTEND_DIST, "index.html")
-        if os.path.isfile(index_path):
-            return FileResponse(index_path, media_type="text/html")
-    return HTMLResponse(
-        "<html><head><title>Moodle Chat Backend</title></head><body>"
-        "<h1>Moodle Chat Backend</h1>"
-        "<p>Open the <a href='/docs'>API docs</a> to test endpoints or POST to <code>/chat</code>.</p>"
-        "</body></html>"
-    )
+async def root(request: Request):
+    if INDEX_HTML is not None:
+        return _index_response(request)
+    return _FALLBACK_HTML_RESPONSE
 
 
-@app.get("/{full_path:path}", response_class=HTMLResponse)
-def spa_fallback(full_path: str):
-    if FRONTEND_DIST:
-        index_path = os.path.join(FRONTEND_DIST, "index.html")
-        if os.path.isfile(index_path):
-            return FileResponse(index_path, media_type="text/html")
-    return Response(status_code=404)
+@app.get('/favicon.ico', include_in_schema=False)
+async def favicon():
+    """Return no content for favicon requests to avoid 404 noise in logs."""
+    return _FAVICON_RESPONSE
 
 
-@app.get('/favicon.ico')
-def favicon():
-    """Return no content for favicon requests to avoid 404 noise in logs."""
-    return Response(status_code=204)
+# Registered after every other route: it matches any path
+@app.get("/{full_path:path}", response_class=HTMLResponse)
+async def spa_fallback(full_path: str, request: Request):
+    # Top-level files of the build (e.g. vite.svg) are served as-is; every other path is a SPA route
+    static_path = _SPA_STATIC_FILES.get(full_path)
+    if static_path is not None:
+        return FileResponse(static_path)
+    if INDEX_HTML is not None:
+        return _index_response(request)
+    return _NOT_FOUND_RESPONSE
 
 
 
@@ -1258,66 +1763,81 @@ if __name__ == "__main__":
     import subprocess
     import uvicorn
     import socket
+    import json
 
-    # Function to check if server is ready
+    # Function to check if server is ready: retry quickly at first, then back off
     def wait_for_server(host, port, timeout=30):
-        start_time = time.time()
-        while time.time() - start_time < timeout:
+        delay = 0.02
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
             try:
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.settimeout(1)
-                result = sock.connect_ex((host, port))
-                sock.close()
-                if result == 0:
+                with socket.create_connection((host, port), timeout=0.2):
                     return True
-            except Exception:
-                pass
-            time.sleep(0.5)
+            except OSError:
+                time.sleep(delay)
+                delay = min(delay * 1.7, 0.5)
         return False
 
-    # Start FastAPI server in a separate thread
-    def start_server():
-        uvicorn.run(app, host="127.0.0.1", port=8000, log_level="info")
-    
-    server_thread = threading.Thread(target=start_server, daemon=True)
-    server_thread.start()
-    
-    # Wait for server to be ready
-    print("Starting server...")
-    if wait_for_server("127.0.0.1", 8000):
+    # Locate Chrome; the path found on the first start is remembered next to the stored credentials
+    def find_chrome():
+        cache_file = get_credentials_dir() / "chrome_path.json"
+        try:
+            cached_path = json.loads(cache_file.read_text(encoding="utf-8")).get("path")
+            if cached_path and os.path.exists(cached_path):
+                return cached_path
+        except (OSError, ValueError):
+            pass
+
+        # Common Chrome paths on Windows
+        chrome_paths = [
+            os.path.expandvars(r"%ProgramFiles%\Google\Chrome\Application\chrome.exe"),
+            os.path.expandvars(r"%ProgramFiles(x86)%\Google\Chrome\Application\chrome.exe"),
+            os.path.expandvars(r"%LocalAppData%\Google\Chrome\Application\chrome.exe"),
+        ]
+        for path in chrome_paths:
+            if os.path.exists(path):
+                try:
+                    cache_file.write_text(json.dumps({"path": path}), encoding="utf-8")
+                except OSError:
+                    pass
+                return path
+        return None
+
+    # Open the UI once the server accepts connections
+    def open_app_window():
+        print("Starting server...")
+        if not wait_for_server("127.0.0.1", 8000):
+            print("Server failed to start!")
+            return
         print("Server is ready!")
         
         # Try to open in Chrome app mode (standalone window)
         url = "http://127.0.0.1:8000"
         try:
-            # Common Chrome paths on Windows
-            chrome_paths = [
-                os.path.expandvars(r"%ProgramFiles%\Google\Chrome\Application\chrome.exe"),
-                os.path.expandvars(r"%ProgramFiles(x86)%\Google\Chrome\Application\chrome.exe"),
-                os.path.expandvars(r"%LocalAppData%\Google\Chrome\Application\chrome.exe"),
-            ]
-            
-            chrome_path = None
-            for path in chrome_paths:
-                if os.path.exists(path):
-                    chrome_path = path
-                    break
+            chrome_path = find_chrome()
             
             if chrome_path:
-                # Open Chrome in app mode (standalone window without browser UI)
-                subprocess.Popen([chrome_path, f"--app={url}", "--window-size=1200,800"])
+                # Open Chrome in app mode (standalone window without browser UI), fully detached
+                # from this process so it neither inherits our handles nor our console
+                if sys.platform == "win32":
+                    detach = {"creationflags": subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP}
+                else:
+                    detach = {"start_new_session": True}
+                subprocess.Popen([chrome_path, f"--app={url}", "--window-size=1200,800"], close_fds=True, **detach)
             else:
                 # Fallback to default browser
                 webbrowser.open(url)
         except Exception:
             # Fallback to default browser
             webbrowser.open(url)
-    else:
-        print("Server failed to start!")
-    
-    # Keep the main thread alive
-    try:
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        pass
+
+    # "desktop" (default) opens the Chrome app window, "server" only serves the API and frontend
+    if os.getenv("MOODLE_CHAT_MODE", "desktop") != "server":
+        threading.Thread(target=open_app_window, daemon=True).start()
+
+    # Run the server in the main thread: it blocks until shutdown and handles Ctrl+C itself,
+    # so no keep-alive loop is needed.
+    # uvicorn[standard] installs uvloop and httptools, which uvicorn picks automatically.
+    # Conversation state, scraper caches and the driver pool live in this process, so it
+    # has to stay a single worker until that state is moved to a shared store.
+    uvicorn.run(app, host="127.0.0.1", port=8000, log_level="info")
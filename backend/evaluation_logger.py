@@ -1,6 +1,10 @@
+import io
 import json
 import os
 import time
+import atexit
+import queue
+import threading
 import uuid
 import hashlib
 import re
@@ -11,6 +15,12 @@ from datetime import datetime, timezone
 from pathlib import Path
 from typing import Optional, Any
 
+try:
+    import orjson
+except ImportError:
+    # orjson ist optional; ohne wird mit dem stdlib-Encoder geschrieben
+    orjson = None
+
 # Cache: (conv_id, session_id) -> Path (damit pro Session nur eine Datei entsteht)
 _SESSION_LOG_PATHS: dict[tuple[str, str], Path] = {}
 
@@ -70,15 +80,137 @@ def _pseudonymize_user(username: str) -> str:
     return hashlib.sha256(raw).hexdigest()
 
 
+class _LogWriter:
+    """
+    Schreibt JSONL-Zeilen in einem Daemon-Thread, damit start_turn/end_turn (laufen im
+    Event-Loop) nur eine Queue befüllen statt pro Zeile Datei öffnen/schreiben/schließen.
+    Alles, was während eines Schreibvorgangs ankommt, wird als ein Batch pro Datei geschrieben.
+    Die Dateien bleiben mit 64-KB-Puffer geöffnet, jeder Batch wird direkt geflusht; nach
+    5 Minuten ohne Zeile werden sie geschlossen, damit beendete Sessions keine Handles belegen.
+    """
+
+    _BATCH_MAX = 1000
+    _BUFFER_SIZE = 64 * 1024
+    _IDLE_SECONDS = 300
+
+    def __init__(self) -> None:
+        self._queue: queue.Queue = queue.Queue(maxsize=10_000)
+        self._files: dict[Path, io.BufferedWriter] = {}
+        self._last_write: dict[Path, float] = {}
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="eval-log-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, path: Path, line: bytes) -> None:
+        # Läuft im Event-Loop und darf nie blockieren: ist der Writer 10k Zeilen im
+        # Rückstand (langsame Platte), wird die Zeile verworfen und gezählt
+        try:
+            self._queue.put_nowait((path, line))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        while True:
+            try:
+                item = self._queue.get(timeout=self._IDLE_SECONDS)
+            except queue.Empty:
+                self._close_idle()
+                continue
+            batch: dict[Path, list[bytes]] = {}
+            count = 0
+            while item is not None:
+                path, line = item
+                batch.setdefault(path, []).append(line)
+                count += 1
+                if count >= self._BATCH_MAX:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            self._write(batch)
+            self._close_idle()
+            if item is None:
+                return
+
+    def _write(self, batch: dict[Path, list[bytes]]) -> None:
+        now = time.monotonic()
+        for path, lines in batch.items():
+            try:
+                f = self._files.get(path)
+                if f is None:
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    f = self._files[path] = io.BufferedWriter(
+                        open(path, "ab", buffering=0), buffer_size=self._BUFFER_SIZE
+                    )
+                f.write(b"".join(lines))
+                # Ein write(2) pro Batch und Datei; danach steht alles in der Datei, damit ein
+                # abgebrochener Prozess (Konsolenfenster geschlossen) keine Records verliert
+                f.flush()
+                self._last_write[path] = now
+            except OSError:
+                # Evaluation-Logs dürfen den Chat nie stören
+                pass
+
+    def _close_idle(self) -> None:
+        cutoff = time.monotonic() - self._IDLE_SECONDS
+        for path in [p for p, ts in self._last_write.items() if ts < cutoff]:
+            del self._last_write[path]
+            f = self._files.pop(path, None)
+            if f is not None:
+                try:
+                    f.close()
+                except OSError:
+                    pass
+
+    def drain_and_close(self) -> None:
+        """Restliche Zeilen schreiben und Dateien schließen (atexit)."""
+        try:
+            self._queue.put(None, timeout=5)
+        except queue.Full:
+            return
+        self._thread.join(timeout=5)
+        if self._thread.is_alive():
+            # Thread schreibt noch in die Handles; nicht unter ihm schließen
+            return
+        for f in self._files.values():
+            try:
+                f.close()
+            except OSError:
+                pass
+        self._files.clear()
+        self._last_write.clear()
+
+
+# STUDIBOT_LOG_SYNC=1 schreibt jede Zeile sofort im aufrufenden Thread (z.B. für Tests)
+_LOG_SYNC = os.getenv("STUDIBOT_LOG_SYNC") == "1"
+_writer: Optional[_LogWriter] = None
+if not _LOG_SYNC:
+    _writer = _LogWriter()
+    atexit.register(_writer.drain_and_close)
+
+
+def _dumps_line(record: dict[str, Any]) -> bytes:
+    """Record als UTF-8-JSON-Zeile inkl. Zeilenumbruch."""
+    if orjson is not None:
+        return orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+
 def _append_jsonl(record: dict[str, Any]) -> None:
     conv_id = record.get("conv_id") or "unknown"
     session_id = record.get("session_id") or _DEFAULT_SESSION_ID
 
     path = _log_path(conv_id, session_id)
-    path.parent.mkdir(parents=True, exist_ok=True)
+    line = _dumps_line(record)
 
-    with open(path, "a", encoding="utf-8") as f:
-        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    if _writer is not None:
+        _writer.put(path, line)
+        return
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "ab") as f:
+        f.write(line)
 
 
 @dataclass
@@ -2,15 +2,26 @@
 import os
 import sys
 import json
+import base64
 import logging
 import hashlib
+import threading
+from functools import lru_cache
 from pathlib import Path
 from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from typing import Optional
 
+try:
+    import orjson
+except ImportError:
+    # orjson is optional; credentials fall back to the stdlib json codec without it
+    orjson = None
 
+
+@lru_cache(maxsize=1)
 def get_credentials_dir() -> Path:
-    """Get the directory where encrypted credentials are stored."""
+    """Get the directory where encrypted credentials are stored (resolved and created once per process)."""
     # Use AppData on Windows, ~/.config on Linux/Mac
     if sys.platform == "win32":
         base = Path(os.getenv("APPDATA", os.path.expanduser("~")))
@@ -22,12 +33,9 @@ def get_credentials_dir() -> Path:
     return cred_dir
 
 
-def get_device_key() -> bytes:
-    """Generate a device-specific encryption key.
-    
-    This creates a consistent key based on machine-specific data.
-    The key is derived from hardware/system identifiers.
-    """
+@lru_cache(maxsize=1)
+def _device_key_bytes() -> bytes:
+    """Raw 32-byte device key derived from machine-specific identifiers (computed once per process)."""
     # Combine multiple system identifiers for uniqueness
     identifiers = [
         os.getenv("COMPUTERNAME", ""),  # Windows
@@ -38,28 +46,68 @@ def get_device_key() -> bytes:
     
     # Create a stable hash from identifiers
     combined = "|".join(identifiers).encode("utf-8")
-    key_material = hashlib.sha256(combined).digest()
+    return hashlib.sha256(combined).digest()
+
+
+def get_device_key() -> bytes:
+    """Generate a device-specific encryption key.
     
+    This creates a consistent key based on machine-specific data.
+    The key is derived from hardware/system identifiers.
+    """
     # Fernet requires a base64-encoded 32-byte key
-    import base64
-    return base64.urlsafe_b64encode(key_material)
+    return base64.urlsafe_b64encode(_device_key_bytes())
+
+
+# Credentials are stored as MAGIC + 12-byte nonce + AES-GCM ciphertext (one AEAD pass, no
+# base64). Files without the prefix are Fernet tokens written by older versions.
+_AESGCM_MAGIC = b"SBG1"
+_NONCE_SIZE = 12
+
+# The device key never changes while the process runs, so each cipher is built once (on first use)
+_CIPHERS = {}
+_CIPHER_LOCK = threading.Lock()
+
+# Serializes reading+caching against writing+clearing credentials.enc, so a load that overlaps
+# a save/delete cannot store the old dict after the cache was cleared
+_CREDENTIALS_LOCK = threading.Lock()
+# Decrypted credentials, kept until save_credentials/delete_credentials reset them. Only a
+# successful load is kept: a missing or unreadable file is read again on the next call.
+_cached_credentials: Optional[dict] = None
+
+
+def _get_cipher(kind: str = "aesgcm"):
+    """Return the cached cipher: "aesgcm" for current data, "fernet" for legacy files."""
+    cipher = _CIPHERS.get(kind)
+    if cipher is None:
+        with _CIPHER_LOCK:
+            cipher = _CIPHERS.get(kind)
+            if cipher is None:
+                cipher = AESGCM(_device_key_bytes()) if kind == "aesgcm" else Fernet(get_device_key())
+                _CIPHERS[kind] = cipher
+    return cipher
 
 
 def encrypt_data(data: dict) -> bytes:
     """Encrypt a dictionary to bytes using device-specific key."""
-    key = get_device_key()
-    cipher = Fernet(key)
-    json_data = json.dumps(data)
-    return cipher.encrypt(json_data.encode("utf-8"))
+    json_data = orjson.dumps(data) if orjson is not None else json.dumps(data).encode("utf-8")
+    nonce = os.urandom(_NONCE_SIZE)
+    return _AESGCM_MAGIC + nonce + _get_cipher().encrypt(nonce, json_data, None)
 
 
 def decrypt_data(encrypted_bytes: bytes) -> Optional[dict]:
     """Decrypt bytes back to dictionary using device-specific key."""
     try:
-        key = get_device_key()
-        cipher = Fernet(key)
-        json_data = cipher.decrypt(encrypted_bytes).decode("utf-8")
-        return json.loads(json_data)
+        if encrypted_bytes.startswith(_AESGCM_MAGIC):
+            payload = encrypted_bytes[len(_AESGCM_MAGIC):]
+            nonce, ciphertext = payload[:_NONCE_SIZE], payload[_NONCE_SIZE:]
+            json_data = _get_cipher().decrypt(nonce, ciphertext, None)
+        else:
+            # Legacy Fernet token; re-encrypted with AES-GCM on the next save
+            json_data = _get_cipher("fernet").decrypt(encrypted_bytes)
+        if orjson is not None:
+            return orjson.loads(json_data)
+        return json.loads(json_data.decode("utf-8"))
     except Exception as e:
         logging.error(f"Error decrypting credentials: {e}")
         return None
@@ -67,6 +115,7 @@ def decrypt_data(encrypted_bytes: bytes) -> Optional[dict]:
 
 def save_credentials(username: str, password: str, api_key: str) -> bool:
     """Save credentials encrypted to local storage."""
+    global _cached_credentials
     try:
         credentials = {
             "username": username,
@@ -78,8 +127,10 @@ def save_credentials(username: str, password: str, api_key: str) -> bool:
         cred_dir = get_credentials_dir()
         cred_file = cred_dir / "credentials.enc"
         
-        with open(cred_file, "wb") as f:
-            f.write(encrypted)
+        with _CREDENTIALS_LOCK:
+            with open(cred_file, "wb") as f:
+                f.write(encrypted)
+            _cached_credentials = None
         
         logging.info("Credentials saved successfully.")
         return True
@@ -89,7 +140,21 @@ def save_credentials(username: str, password: str, api_key: str) -> bool:
 
 
 def load_credentials() -> Optional[dict]:
-    """Load and decrypt credentials from local storage."""
+    """Load and decrypt credentials from local storage.
+
+    The result is cached until save_credentials/delete_credentials clear the cache.
+    """
+    global _cached_credentials
+    with _CREDENTIALS_LOCK:
+        if _cached_credentials is None:
+            _cached_credentials = _read_credentials()
+        return _cached_credentials
+
+
+# credentials.enc is only written through save_credentials/delete_credentials, which reset
+# the cache, so the decrypted dict can stay cached until then instead of expiring on a timer.
+# Only called with _CREDENTIALS_LOCK held.
+def _read_credentials() -> Optional[dict]:
     try:
         cred_dir = get_credentials_dir()
         cred_file = cred_dir / "credentials.enc"
@@ -109,12 +174,17 @@ def load_credentials() -> Optional[dict]:
 
 def delete_credentials() -> bool:
     """Delete stored credentials."""
+    global _cached_credentials
     try:
         cred_dir = get_credentials_dir()
         cred_file = cred_dir / "credentials.enc"
         
-        if cred_file.exists():
-            cred_file.unlink()
+        with _CREDENTIALS_LOCK:
+            existed = cred_file.exists()
+            if existed:
+                cred_file.unlink()
+            _cached_credentials = None
+        if existed:
             logging.info("Credentials deleted successfully.")
             return True
         
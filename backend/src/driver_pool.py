@@ -0,0 +1,200 @@
+"""Reusable headless Chrome sessions for the Moodle/STINE scrapers."""
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from types import SimpleNamespace
+from typing import Optional
+
+
+@lru_cache(maxsize=1)
+def selenium_api() -> SimpleNamespace:
+    """Import selenium on first use and hand out the names the scrapers need.
+
+    The imports stay lazy so the app can start without these packages; a missing package
+    raises ImportError here (and is retried on the next call).
+    """
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.common.exceptions import TimeoutException
+
+    return SimpleNamespace(
+        webdriver=webdriver, Options=Options, By=By, WebDriverWait=WebDriverWait, EC=EC,
+        TimeoutException=TimeoutException,
+    )
+
+
+def visible_text(driver, css_selector: str = "body") -> Optional[str]:
+    """Rendered text of the first element matching `css_selector`, one non-empty line per line.
+
+    Reads innerText inside the browser, so only the text crosses the WebDriver connection
+    instead of the serialized page (page_source) that would then be parsed again in Python.
+    Returns None if no element matches.
+    """
+    text = driver.execute_script(
+        "const el = document.querySelector(arguments[0]); return el ? el.innerText : null;", css_selector
+    )
+    if text is None:
+        return None
+    return "\n".join(stripped for line in text.splitlines() if (stripped := line.strip()))
+
+
+# Sub-resources the scrapers never read: fonts, media and analytics. Blocked for the whole
+# session via CDP, so they are not even requested (images are disabled via blink-settings).
+BLOCKED_URL_PATTERNS = [
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.mp4", "*.webm",
+    "*google-analytics.com*", "*googletagmanager.com*", "*matomo*", "*piwik*",
+]
+
+
+def find_first(driver, *locators):
+    """Return the first element found by the (By, value) locators, tried in the given order.
+
+    Lets a scraper try a cheap locator (By.NAME, CSS) before a text-matching XPath fallback.
+    """
+    for by, value in locators:
+        elements = driver.find_elements(by, value)
+        if elements:
+            return elements[0]
+    raise LookupError(f"No element found for {locators}")
+
+
+def make_driver(headless: bool = True):
+    """Start a new Chrome WebDriver."""
+    api = selenium_api()
+    options = api.Options()
+    if headless:
+        # older/newer chrome headless flags differ; this should be broadly compatible
+        options.add_argument("--headless")
+        options.add_argument("--disable-gpu")
+        options.add_argument("--disable-dev-shm-usage")
+    # The scrapers wait explicitly for the elements they need, so navigation can return at
+    # DOMContentLoaded instead of after every image, font and tracker has loaded
+    options.page_load_strategy = "eager"
+    options.add_argument("--blink-settings=imagesEnabled=false")
+    options.add_argument("--disable-extensions")
+    options.add_argument("--disable-background-networking")
+    options.add_argument("--disable-sync")
+    options.add_experimental_option("prefs", {
+        "profile.managed_default_content_settings.images": 2,
+        "profile.default_content_setting_values.notifications": 2,
+    })
+    driver = api.webdriver.Chrome(options=options)
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URL_PATTERNS})
+    except Exception as e:
+        # Only an optimization; the pages still work with everything loaded
+        logging.warning(f"[DriverPool] Could not block sub-resources: {e}")
+    return driver
+
+
+class DriverPool:
+    """Thread-safe pool of headless Chrome sessions.
+
+    Drivers are started lazily (at most `size` at a time) and kept alive between
+    checkouts, so only the first scrape pays the browser start-up cost. All cookies
+    are cleared when a driver is returned, so no login session leaks between users.
+    """
+
+    def __init__(self, size: int = 4):
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._closed = False
+
+    @contextmanager
+    def checkout(self):
+        """Borrow a driver for the duration of the with-block."""
+        self._slots.acquire()
+        try:
+            driver = self._take_idle()
+            if driver is None:
+                logging.info("[DriverPool] Starting new Chrome WebDriver")
+                driver = make_driver()
+            try:
+                yield driver
+            finally:
+                self._release(driver)
+        finally:
+            self._slots.release()
+
+    def prewarm(self):
+        """Start one driver ahead of the first checkout, so that scrape skips the Chrome start-up.
+
+        Best effort: without selenium or a working Chrome the first scrape reports the error.
+        """
+        if not self._slots.acquire(blocking=False):
+            return
+        try:
+            driver = make_driver()
+        except Exception as e:
+            logging.warning(f"[DriverPool] Could not prestart Chrome WebDriver: {e}")
+            return
+        finally:
+            self._slots.release()
+        if self._closed:
+            _quit(driver)
+        else:
+            self._idle.put(driver)
+
+    def _take_idle(self):
+        """Pop the most recently used idle driver whose session is still alive, or None."""
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                return None
+            try:
+                # Chrome may have crashed while idle; one cheap command tells us before the scrape does
+                driver.current_url
+                return driver
+            except Exception as e:
+                logging.warning(f"[DriverPool] Idle driver is dead, discarding it: {e}")
+                _quit(driver)
+
+    def _release(self, driver):
+        if not self._closed:
+            try:
+                # delete_all_cookies() only covers the current domain; the SSO login lives on another one
+                driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+                driver.get("about:blank")
+                self._idle.put(driver)
+                return
+            except Exception as e:
+                # Session is dead (e.g. InvalidSessionIdException); a fresh driver is built next time
+                logging.warning(f"[DriverPool] Discarding broken driver: {e}")
+        _quit(driver)
+
+    def close(self):
+        """Quit all idle drivers; drivers still checked out are quit when returned."""
+        self._closed = True
+        while True:
+            try:
+                _quit(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+
+@contextmanager
+def driver_session(pool: Optional[DriverPool] = None, headless: bool = True):
+    """Yield a pooled driver if a pool is given, otherwise a one-off driver that is quit afterwards."""
+    if pool is not None and headless:
+        with pool.checkout() as driver:
+            yield driver
+        return
+    driver = make_driver(headless)
+    try:
+        yield driver
+    finally:
+        _quit(driver)
+
+
+def _quit(driver):
+    try:
+        driver.quit()
+    except Exception:
+        pass
@@ -3,7 +3,7 @@ Google Calendar API integration module
 Handles OAuth flow and fetching calendar events
 """
 import os
-import requests
+import httpx
 from typing import Optional, Dict, List
 from datetime import datetime, timedelta
 
@@ -32,11 +32,12 @@ GOOGLE_TOKEN_URL = "https://oauth2.googleapis.com/token"
 GOOGLE_CALENDAR_API = "https://www.googleapis.com/calendar/v3/calendars/primary/events"
 
 
-def exchange_code_for_token(code: str, redirect_uri: str) -> Optional[Dict]:
+async def exchange_code_for_token(client: httpx.AsyncClient, code: str, redirect_uri: str) -> Optional[Dict]:
     """
     Exchange authorization code for access token and refresh token
     
     Args:
+        client: Shared HTTP client (connection pool reused across calls)
         code: Authorization code from Google
         redirect_uri: Redirect URI (should be "postmessage" for implicit flow)
     """
@@ -55,11 +56,11 @@ def exchange_code_for_token(code: str, redirect_uri: str) -> Optional[Dict]:
         print(f"[OAuth] Client Secret: {GOOGLE_CLIENT_SECRET[:10]}..." if GOOGLE_CLIENT_SECRET else "[OAuth] Client Secret: NOT SET")
         print(f"[OAuth] Authorization Code: {code[:20]}...")
         
-        response = requests.post(GOOGLE_TOKEN_URL, data=data, timeout=10)
+        response = await client.post(GOOGLE_TOKEN_URL, data=data, timeout=10)
         
         print(f"[OAuth] Google Response Status: {response.status_code}")
         
-        if not response.ok:
+        if not response.is_success:
             error_body = response.text
             print(f"[OAuth] ERROR - Google returned {response.status_code}")
             print(f"[OAuth] Response body: {error_body}")
@@ -80,10 +81,10 @@ def exchange_code_for_token(code: str, redirect_uri: str) -> Optional[Dict]:
         print(f"[OAuth] ===== OAuth Token Exchange Complete =====\n")
         return result
         
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         print(f"[OAuth] ✗ Request timeout while exchanging code")
         return None
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"[OAuth] ✗ HTTP error: {e}")
         if hasattr(e, 'response') and e.response is not None:
             print(f"[OAuth] Response status: {e.response.status_code}")
@@ -96,7 +97,7 @@ def exchange_code_for_token(code: str, redirect_uri: str) -> Optional[Dict]:
         return None
 
 
-def refresh_access_token(refresh_token: str) -> Optional[Dict]:
+async def refresh_access_token(client: httpx.AsyncClient, refresh_token: str) -> Optional[Dict]:
     """
     Use refresh token to get a new access token
     """
@@ -108,7 +109,7 @@ def refresh_access_token(refresh_token: str) -> Optional[Dict]:
             "grant_type": "refresh_token",
         }
         
-        response = requests.post(GOOGLE_TOKEN_URL, data=data)
+        response = await client.post(GOOGLE_TOKEN_URL, data=data)
         response.raise_for_status()
         
         return response.json()
@@ -117,7 +118,8 @@ def refresh_access_token(refresh_token: str) -> Optional[Dict]:
         return None
 
 
-def fetch_calendar_events(
+async def fetch_calendar_events(
+    client: httpx.AsyncClient,
     access_token: str,
     time_min: Optional[str] = None,
     time_max: Optional[str] = None
@@ -126,6 +128,7 @@ def fetch_calendar_events(
     Fetch calendar events from Google Calendar API
     
     Args:
+        client: Shared HTTP client (connection pool reused across calls)
         access_token: Google OAuth access token
         time_min: ISO format datetime string for start of range
         time_max: ISO format datetime string for end of range
@@ -162,11 +165,11 @@ def fetch_calendar_events(
         print(f"[Calendar] API URL: {GOOGLE_CALENDAR_API}")
         print(f"[Calendar] Parameters: {params}")
         
-        response = requests.get(GOOGLE_CALENDAR_API, headers={"Authorization": f"Bearer {access_token}"}, params=params)
+        response = await client.get(GOOGLE_CALENDAR_API, headers={"Authorization": f"Bearer {access_token}"}, params=params)
         
         print(f"[Calendar] Response status: {response.status_code}")
         
-        if not response.ok:
+        if not response.is_success:
             print(f"[Calendar] Error response: {response.text}")
         
         response.raise_for_status()
@@ -204,11 +207,12 @@ def fetch_calendar_events(
         return []
 
 
-def create_calendar_event(access_token: str, event_title: str, event_date: str) -> Optional[Dict]:
+async def create_calendar_event(client: httpx.AsyncClient, access_token: str, event_title: str, event_date: str) -> Optional[Dict]:
     """
     Create an event in Google Calendar
     
     Args:
+        client: Shared HTTP client (connection pool reused across calls)
         access_token: Google OAuth access token
         event_title: Title/description of the event
         event_date: ISO date string (YYYY-MM-DD)
@@ -235,7 +239,7 @@ def create_calendar_event(access_token: str, event_title: str, event_date: str)
             "Content-Type": "application/json",
         }
         
-        response = requests.post(
+        response = await client.post(
             GOOGLE_CALENDAR_API,
             headers=headers,
             json=event_data
@@ -243,7 +247,7 @@ def create_calendar_event(access_token: str, event_title: str, event_date: str)
         
         print(f"[Calendar] Response status: {response.status_code}")
         
-        if not response.ok:
+        if not response.is_success:
             print(f"[Calendar] Error creating event. Status: {response.status_code}")
             print(f"[Calendar] Error details: {response.text}")
             response.raise_for_status()
@@ -262,7 +266,7 @@ def create_calendar_event(access_token: str, event_title: str, event_date: str)
         return None
 
 
-def get_user_info(access_token: str) -> Optional[Dict]:
+async def get_user_info(client: httpx.AsyncClient, access_token: str) -> Optional[Dict]:
     """
     Fetch user profile information from Google
     """
@@ -271,7 +275,7 @@ def get_user_info(access_token: str) -> Optional[Dict]:
             "Authorization": f"Bearer {access_token}",
         }
         
-        response = requests.get(
+        response = await client.get(
             "https://www.googleapis.com/oauth2/v2/userinfo",
             headers=headers
         )
@@ -284,11 +288,12 @@ def get_user_info(access_token: str) -> Optional[Dict]:
         return None
 
 
-def delete_calendar_event(access_token: str, event_id: str) -> bool:
+async def delete_calendar_event(client: httpx.AsyncClient, access_token: str, event_id: str) -> bool:
     """
     Delete an event from Google Calendar
     
     Args:
+        client: Shared HTTP client (connection pool reused across calls)
         access_token: Google OAuth access token
         event_id: The Google Calendar event ID (without 'google-' prefix)
     
@@ -303,14 +308,14 @@ def delete_calendar_event(access_token: str, event_id: str) -> bool:
             "Authorization": f"Bearer {access_token}",
         }
         
-        response = requests.delete(
+        response = await client.delete(
             f"https://www.googleapis.com/calendar/v3/calendars/primary/events/{event_id}",
             headers=headers
         )
         
         print(f"[Calendar] Response status: {response.status_code}")
         
-        if not response.ok:
+        if not response.is_success:
             print(f"[Calendar] Error deleting event: {response.text}")
             response.raise_for_status()
         
@@ -324,11 +329,12 @@ def delete_calendar_event(access_token: str, event_id: str) -> bool:
         return False
 
 
-def update_calendar_event(access_token: str, event_id: str, event_title: str, event_date: str) -> Optional[Dict]:
+async def update_calendar_event(client: httpx.AsyncClient, access_token: str, event_id: str, event_title: str, event_date: str) -> Optional[Dict]:
     """
     Update an event in Google Calendar
     
     Args:
+        client: Shared HTTP client (connection pool reused across calls)
         access_token: Google OAuth access token
         event_id: The Google Calendar event ID (without 'google-' prefix)
         event_title: New title/description of the event
@@ -358,7 +364,7 @@ def update_calendar_event(access_token: str, event_id: str, event_title: str, ev
             "Content-Type": "application/json",
         }
         
-        response = requests.patch(
+        response = await client.patch(
             f"https://www.googleapis.com/calendar/v3/calendars/primary/events/{event_id}",
             headers=headers,
             json=event_data
@@ -366,7 +372,7 @@ def update_calendar_event(access_token: str, event_id: str, event_title: str, ev
         
         print(f"[Calendar] Response status: {response.status_code}")
         
-        if not response.ok:
+        if not response.is_success:
             print(f"[Calendar] Error updating event: {response.text}")
             response.raise_for_status()
         
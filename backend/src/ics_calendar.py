@@ -3,7 +3,15 @@ import os
 import datetime
 import logging
 import re
-from typing import Optional, Tuple, List
+from typing import Iterator, Optional, Tuple, List
+
+from src.llm import get_openai_class, get_openai_client
+
+
+# Directory where raw ICS responses are written for debugging (served by /download_ics)
+DEBUG_ICS_DIR = os.path.dirname(os.path.abspath(__file__))
+# Debug files are only written when STUDIBOT_DEBUG_ICS=1; otherwise no disk I/O per request
+DEBUG_ICS = os.getenv("STUDIBOT_DEBUG_ICS") == "1"
 
 
 def pick_api_key(provided: Optional[str]) -> Optional[str]:
@@ -16,6 +24,28 @@ def pick_api_key(provided: Optional[str]) -> Optional[str]:
     return env_key or None
 
 
+def iter_ics_events(ics_content: str) -> Iterator[dict]:
+    """Yield the raw DTSTART/SUMMARY values of every VEVENT in a single pass over the lines.
+
+    Property parameters (e.g. ';VALUE=DATE') are dropped; folded continuation lines are not
+    needed for the properties we consume.
+    """
+    current = None
+    for line in ics_content.splitlines():
+        line = line.strip()
+        if line == "BEGIN:VEVENT":
+            current = {}
+        elif line == "END:VEVENT":
+            if current is not None:
+                yield current
+            current = None
+        elif current is not None and ":" in line:
+            name, value = line.split(":", 1)
+            name = name.split(";", 1)[0]
+            if name in ("DTSTART", "SUMMARY") and name not in current:
+                current[name] = value
+
+
 def extract_events_from_ics(ics_content: str) -> List[dict]:
     """Extract calendar events from ICS content.
     
@@ -26,39 +56,20 @@ def extract_events_from_ics(ics_content: str) -> List[dict]:
     
     logging.info(f"[ICS] Extracting events from ICS content ({len(ics_content)} chars)")
     
-    # Parse ICS format
-    # Look for VEVENT blocks
-    event_pattern = r'BEGIN:VEVENT.*?END:VEVENT'
-    events_text = re.findall(event_pattern, ics_content, re.DOTALL)
-    
-    logging.info(f"[ICS] Found {len(events_text)} VEVENT blocks")
-    
-    for event_text in events_text:
-        # Extract DTSTART (date) - support multiple formats:
-        # - DTSTART;VALUE=DATE:20260204
-        # - DTSTART;VALUE=DATE-TIME:20260204T123000Z
-        # - DTSTART:20260204T123000Z
-        # We want to extract just the date part (YYYYMMDD)
-        date_match = re.search(r'DTSTART(?:;VALUE=(?:DATE|DATE-TIME))?:(\d{8})', event_text)
-        if not date_match:
-            logging.warning(f"[ICS] No DTSTART found in event: {event_text[:100]}...")
+    for event in iter_ics_events(ics_content):
+        # DTSTART may be a date or a date-time (20260204 / 20260204T123000Z);
+        # we only need the date part (YYYYMMDD)
+        date_str = event.get("DTSTART", "")[:8]
+        if len(date_str) != 8 or not date_str.isdigit():
+            logging.warning(f"[ICS] No valid DTSTART found in event: {event}")
             continue
-        
-        date_str = date_match.group(1)
         # Format as ISO date: YYYYMMDD -> YYYY-MM-DD
-        if len(date_str) == 8 and date_str.isdigit():
-            date_iso = f"{date_str[0:4]}-{date_str[4:6]}-{date_str[6:8]}"
-            logging.info(f"[ICS] Extracted date: {date_str} -> {date_iso}")
-        else:
-            logging.warning(f"[ICS] Invalid date format: {date_str}")
-            continue
-        # Extract SUMMARY (title)
-        summary_match = re.search(r'SUMMARY:([^\r\n]*)', event_text)
-        if not summary_match:
+        date_iso = f"{date_str[0:4]}-{date_str[4:6]}-{date_str[6:8]}"
+
+        title = event.get("SUMMARY", "").strip()
+        if "SUMMARY" not in event:
             title = "Termin"
             logging.warning(f"[ICS] No SUMMARY found, using default: {title}")
-        else:
-            title = summary_match.group(1).strip()
         
         logging.info(f"[ICS] Extracted event: {date_iso} - {title}")
         events.append({
@@ -114,11 +125,11 @@ def make_calendar_entries(termine: str, api_key: Optional[str]) -> Tuple[Optiona
     """Parse dates from appointment text and create ICS format calendar entries.
     
     Returns:
-        Tuple of (saved_filename_or_none, ics_content)
+        Tuple of (saved_filename_or_none, ics_content); a debug file is only saved with STUDIBOT_DEBUG_ICS=1
     """
     # ask ChatGPT to parse the dates into calendar entries
     try:
-        from openai import OpenAI
+        get_openai_class()
     except ImportError:
         return None, "Fehler: 'openai' Paket nicht installiert."
 
@@ -126,7 +137,7 @@ def make_calendar_entries(termine: str, api_key: Optional[str]) -> Tuple[Optiona
     if not key:
         return None, "Kein API-Key vorhanden. Bitte in der App speichern und erneut versuchen."
 
-    client = OpenAI(api_key=key)
+    client = get_openai_client(key)
     today = datetime.date.today()
     current_year = today.year
     next_year = current_year + 1
@@ -151,16 +162,21 @@ def make_calendar_entries(termine: str, api_key: Optional[str]) -> Tuple[Optiona
             {"role": "user", "content": user_message}
         ]
     )
-    # Persist the raw ICS text to a timestamped debug file for troubleshooting and return filename.
     ics_content = response.choices[0].message.content or ""
     ics_content = _normalize_ics_dates(ics_content)
+    if not DEBUG_ICS:
+        return None, ics_content
+
+    # Persist the raw ICS text to a timestamped debug file for troubleshooting and return filename.
+    # Written to a temp file first and renamed, so /download_ics never serves a partial file.
     saved_basename = None
     try:
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        debug_dir = os.path.dirname(__file__)
-        debug_path = os.path.join(debug_dir, f"debug_ics_response_{timestamp}.ics")
-        with open(debug_path, "w", encoding="utf-8") as f:
+        debug_path = os.path.join(DEBUG_ICS_DIR, f"debug_ics_response_{timestamp}.ics")
+        tmp_path = debug_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
             f.write(ics_content)
+        os.replace(tmp_path, debug_path)
         saved_basename = os.path.basename(debug_path)
         logging.info("Wrote ICS debug file: %s", debug_path)
     except Exception as e:
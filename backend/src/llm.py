@@ -3,8 +3,129 @@ import asyncio
 import datetime
 import logging
 import os
+import re
+from functools import lru_cache
 from typing import Optional
 
+from cachetools import TTLCache
+
+# LLM intent labels per normalized message; the classification does not depend on the user
+INTENT_CACHE_TTL_SECONDS = 3600
+_intent_cache = TTLCache(maxsize=4096, ttl=INTENT_CACHE_TTL_SECONDS)
+
+# Deterministic intent patterns for short messages; a message resolves locally only if exactly
+# one label matches, anything ambiguous still goes to the LLM. Labels flagged True name a data
+# source and only count in explicit commands ('Zeig mir meine Prüfungen'): a bare keyword in a
+# question or statement ('wie viele Prüfungen sind es noch') is no evidence of a data request.
+LOCAL_INTENT_MAX_WORDS = 8
+_LOCAL_INTENT_PATTERNS = (
+    ("get_moodle_appointments", True, re.compile(r"\bmoodle\b|\babgabe(?:n|termine?)?\b|\bdeadlines?\b")),
+    ("get_stine_messages", True, re.compile(r"\bstine[- ]?nachrichten?\b|\bnachrichten? (?:in|auf|von) stine\b")),
+    ("get_stine_exams", True, re.compile(r"\bprüfungen\b|\bprüfungstermine?\b|\bklausurtermine?\b|\bexams?\b")),
+    ("get_mail", True, re.compile(r"\be-?mails?\b|\bpostfach\b")),
+    ("get_all_appointments", False, re.compile(r"^was (?:steht|liegt) (?:diese woche|heute|morgen|bald)? ?an\??$")),
+    ("greeting", False, re.compile(r"^(?:hallo|hi|hey|hello|moin|servus|guten (?:morgen|tag|abend))[!.]*$")),
+    ("help", False, re.compile(r"^(?:hilfe|help|was kannst du(?: alles)?(?: tun| machen)?)[?!.]*$")),
+    # Whole-message answers to the calendar question; only tried while that question is pending
+    ("calendar_yes", False, re.compile(r"^(?:ja|j|yes|y|klar|gerne|ja,? bitte|ja,? gerne)[.!]*$")),
+    ("calendar_no", False, re.compile(r"^(?:nein|n|no|nö|nein,? danke)[.!]*$")),
+)
+_LOCAL_COMMAND_RE = re.compile(r"^(?:bitte )?(?:zeig(?:e)?|liste?|gib|hol(?:e)?|show|list)\b")
+# Negations, emotions and study/preparation words mean the message is about the topic rather
+# than a request for the data ('ich hab angst vor den prüfungen'); those always go to the LLM
+_LOCAL_SKIP_RE = re.compile(
+    r"\bkein\w*\b|\bnicht\b|vorbereit|\blern|versteh|erklär|angst|stress|sorge|panik|überforder"
+)
+
+# Labels the LLM may answer with; calendar_yes/calendar_no let short replies like 'Ja'/'Nein' be classified
+_INTENT_LABELS = (
+    "get_moodle_appointments",
+    "get_stine_messages",
+    "get_stine_exams",
+    "get_all_appointments",
+    "get_mail",
+    "greeting",
+    "help",
+    "calendar_yes",
+    "calendar_no",
+    "start_exam_wizard",
+    "unknown",
+)
+_INTENT_LABEL_SET = frozenset(_INTENT_LABELS)
+_LABEL_TOKEN_RE = re.compile(r"[a-z_]+")
+
+# Classifier instructions, built once; sent as the system message so only the user's text
+# varies between calls
+_INTENT_SYSTEM_PROMPT = (
+    "Classify the user's message. Reply with exactly one label and nothing else:\n"
+    "get_moodle_appointments: Moodle appointments, deadlines, 'Aufgaben'\n"
+    "get_stine_messages: Stine messages, 'Stine Nachrichten'\n"
+    "get_stine_exams: Stine exams, 'Stine Prüfungen'\n"
+    "get_all_appointments: everything coming up across Moodle and Stine, e.g. 'Was steht diese Woche an?'\n"
+    "get_mail: email, 'E-Mail'\n"
+    "greeting: hello, hi, hallo\n"
+    "help: help or how to use the bot\n"
+    "calendar_yes: affirmative like 'ja', 'yes'\n"
+    "calendar_no: negative like 'nein', 'no'\n"
+    "start_exam_wizard: exam prep, e.g. Klausurvorbereitung, Lernplan, Wizard starten\n"
+    "unknown: anything else"
+)
+
+
+_CALENDAR_LABELS = frozenset(("calendar_yes", "calendar_no"))
+
+
+def classify_intent_locally(message: str, awaiting_calendar: bool = False) -> Optional[str]:
+    """Return the intent label if a short message matches exactly one local pattern, else None.
+
+    Bare replies like 'ja'/'nein' only count as calendar answers when awaiting_calendar is set.
+    """
+    msg = message.strip().lower()
+    if not msg or len(msg.split()) > LOCAL_INTENT_MAX_WORDS or _LOCAL_SKIP_RE.search(msg):
+        return None
+    is_command = _LOCAL_COMMAND_RE.match(msg) is not None
+    matched = None
+    for label, needs_command, pattern in _LOCAL_INTENT_PATTERNS:
+        if needs_command and not is_command:
+            continue
+        if label in _CALENDAR_LABELS and not awaiting_calendar:
+            continue
+        if pattern.search(msg):
+            if matched is not None:
+                return None
+            matched = label
+    return matched
+
+
+@lru_cache(maxsize=1)
+def get_openai_class():
+    """Import the OpenAI client class on first use; raises ImportError if 'openai' is missing."""
+    from openai import OpenAI
+    return OpenAI
+
+
+@lru_cache(maxsize=1)
+def get_async_openai_class():
+    """Like get_openai_class, for the asyncio client (AsyncOpenAI)."""
+    from openai import AsyncOpenAI
+    return AsyncOpenAI
+
+
+# Per-request limit for OpenAI calls. The SDK default (10 minutes) would let one stalled call
+# hold a thread of the blocking pool, and the user's /chat request, for that long.
+OPENAI_TIMEOUT_SECONDS = 30.0
+
+
+@lru_cache(maxsize=16)
+def get_openai_client(api_key: str):
+    """Shared OpenAI client per API key, so its HTTP connection pool is reused across requests."""
+    return get_openai_class()(api_key=api_key, timeout=OPENAI_TIMEOUT_SECONDS)
+
+
+@lru_cache(maxsize=16)
+def get_async_openai_client(api_key: str):
+    """Shared AsyncOpenAI client per API key, for calls awaited directly on the event loop."""
+    return get_async_openai_class()(api_key=api_key, timeout=OPENAI_TIMEOUT_SECONDS)
 
 
 def pick_api_key(provided: Optional[str]) -> Optional[str]:
@@ -16,11 +137,14 @@ def pick_api_key(provided: Optional[str]) -> Optional[str]:
     return env_key or None
 
 
-def ask_chatgpt_exams(exams_text: str, api_key: Optional[str]) -> str:
-    from backend import latestMessage
-    """Send exam data to ChatGPT and return formatted response."""
+def ask_chatgpt_exams(exams_text: str, api_key: Optional[str], user_message: str = "") -> str:
+    """Send exam data to ChatGPT and return formatted response.
+
+    `user_message` is the chat message that asked for the exams; restrictions in it
+    (e.g. a single module) are passed on to the model.
+    """
     try:
-        from openai import OpenAI
+        get_openai_class()
     except ImportError:
         return "Fehler: 'openai' Paket nicht installiert."
 
@@ -28,13 +152,13 @@ def ask_chatgpt_exams(exams_text: str, api_key: Optional[str]) -> str:
     if not key:
         return "Kein API-Key vorhanden. Bitte in der App speichern und erneut versuchen."
 
-    client = OpenAI(api_key=key)
+    client = get_openai_client(key)
     response = client.chat.completions.create(
         model="gpt-5-mini",
         messages=[
             {"role": "system", "content": "Du bist ein hilfreicher Assistent, der Stine-Prüfungen für den Benutzer zusammenfasst und keine Rückfragen stellt."},
             {"role": "user", "content": " Nutze Markdown. Überschriften mit ##, fettgedruckte Labels mit **, und Aufzählungen mit -.\n"
-             " Hier sind meine Stine-Prüfungen:\n" + exams_text + " Hier sind Einschränkungen die beachtet werden sollen: " +  latestMessage }
+             " Hier sind meine Stine-Prüfungen:\n" + exams_text + " Hier sind Einschränkungen die beachtet werden sollen: " + user_message}
         ]
     )
     # Normalize the response text and append the calendar question (same wording used elsewhere)
@@ -42,20 +166,9 @@ def ask_chatgpt_exams(exams_text: str, api_key: Optional[str]) -> str:
     return resp_text
 
 
-def ask_chatgpt_moodle(termine: str, api_key: Optional[str]) -> str:
-    """Send Moodle appointments to ChatGPT and return formatted response."""
-    from backend import latestMessage
-    try:
-        from openai import OpenAI
-    except ImportError:
-        return "Fehler: 'openai' Paket nicht installiert."
-
-    key = pick_api_key(api_key)
-    if not key:
-        return "Kein API-Key vorhanden. Bitte in der App speichern und erneut versuchen."
-
-    client = OpenAI(api_key=key)
-    user_message = (
+def _moodle_user_message(termine: str, latest_message: str) -> str:
+    """Build the Moodle summary prompt around the given appointment text."""
+    return (
         " Nutze Markdown. Überschriften mit ##, fettgedruckte Labels mit **, und Aufzählungen mit -.\n"
         " Hier sind meine Moodle-Aufgaben:\n" + termine + "\n\n"
         + "Beginne die Nachricht mit 'Hier sind deine Moodle-Aufgaben:'. Heute ist der " + datetime.date.today().isoformat() + ".\n\n"
@@ -64,19 +177,80 @@ def ask_chatgpt_moodle(termine: str, api_key: Optional[str]) -> str:
         " WICHTIG: Auch wenn mehrere Termine das selbe Datum haben, liste jeden Termin einzeln auf.\n\n"
         " WICHTIG: Beachte potentielle terminliche oder fachliche Einschränkungen in folgender Nutzereingabe.\n\n"
         "(z.B. Nur Termine für ein bestimmtes Modul oder nur Termine in den nächsten 3 Tagen oder ähnliches. Andere Wünsche in der Nutzeringabe können ignoriert werden).\n\n"
-        " Hier die Nutzereingabe: " + latestMessage
+        " Hier die Nutzereingabe: " + latest_message
     )
+
+
+def ask_chatgpt_moodle(termine: str, api_key: Optional[str], user_message: str = "") -> str:
+    """Send Moodle appointments to ChatGPT and return formatted response.
+
+    `user_message` is the chat message that asked for the appointments (see ask_chatgpt_exams).
+    """
+    try:
+        get_openai_class()
+    except ImportError:
+        return "Fehler: 'openai' Paket nicht installiert."
+
+    key = pick_api_key(api_key)
+    if not key:
+        return "Kein API-Key vorhanden. Bitte in der App speichern und erneut versuchen."
+
+    client = get_openai_client(key)
     response = client.chat.completions.create(
         model="gpt-5-mini",
         messages=[
             {"role": "system", "content": "Du bist ein hilfreicher Assistent, der Moodle-Aufgaben für den Benutzer zusammenfasst und keine Rückfragen stellt."},
-            {"role": "user", "content": user_message}
+            {"role": "user", "content": _moodle_user_message(termine, user_message)}
+        ]
+    )
+    resp_text = response.choices[0].message.content + "\n\nSoll ich dir die Termine auch in deinen Kalender eintragen?"
+    return resp_text
+
+
+def ask_chatgpt_all_appointments(appointments: str, api_key: Optional[str], user_message: str = "") -> str:
+    """Summarize Moodle deadlines and Stine exams together (see ask_chatgpt_exams for `user_message`).
+
+    `appointments` holds a 'Moodle-Aufgaben:' and/or a 'Stine-Prüfungen:' section.
+    """
+    try:
+        get_openai_class()
+    except ImportError:
+        return "Fehler: 'openai' Paket nicht installiert."
+
+    key = pick_api_key(api_key)
+    if not key:
+        return "Kein API-Key vorhanden. Bitte in der App speichern und erneut versuchen."
+
+    client = get_openai_client(key)
+    response = client.chat.completions.create(
+        model="gpt-5-mini",
+        messages=[
+            {"role": "system", "content": "Du bist ein hilfreicher Assistent, der Moodle-Aufgaben und Stine-Prüfungen für den Benutzer zusammenfasst und keine Rückfragen stellt."},
+            {"role": "user", "content": " Nutze Markdown. Überschriften mit ##, fettgedruckte Labels mit **, und Aufzählungen mit -.\n"
+             " Hier sind meine Termine:\n" + appointments + "\n\n"
+             " Heute ist der " + datetime.date.today().isoformat() + ". Sortiere alle Termine chronologisch, nenne sie abhängig vom heutigen Datum"
+             " (z.B. 'morgen', 'in zwei Tagen') und gib jeweils an, ob es eine Moodle-Aufgabe oder eine Prüfung ist und zu welchem Modul sie gehört.\n\n"
+             " Hier sind Einschränkungen die beachtet werden sollen: " + user_message}
         ]
     )
     resp_text = response.choices[0].message.content + "\n\nSoll ich dir die Termine auch in deinen Kalender eintragen?"
     return resp_text
 
 
+def ask_chatgpt_moodle_structured(parsed: dict, api_key: Optional[str], user_message: str = "") -> str:
+    """Like ask_chatgpt_moodle, but builds a compact prompt from parsed entries.
+
+    Args:
+        parsed: Column arrays as returned by parse_moodle_entries ('dates', 'titles', 'courses').
+        api_key: API key to call the LLM.
+        user_message: The chat message that asked for the appointments.
+    """
+    lines = []
+    for date, title, course in zip(parsed["dates"], parsed["titles"], parsed["courses"]):
+        lines.append(f"- {date} | {title} | {course}" if course else f"- {date} | {title}")
+    return ask_chatgpt_moodle("\n".join(lines), api_key, user_message)
+
+
 def ask_chatgpt_topic_help(module: str, topic: str, materials: str, user_question: str, api_key: Optional[str]) -> str:
     """Generate an explanation for a given topic (exercises only if explicitly requested).
 
@@ -88,7 +262,7 @@ def ask_chatgpt_topic_help(module: str, topic: str, materials: str, user_questio
         api_key: API key to call the LLM.
     """
     try:
-        from openai import OpenAI
+        get_openai_class()
     except ImportError:
         return "Fehler: 'openai' Paket nicht installiert."
 
@@ -96,7 +270,7 @@ def ask_chatgpt_topic_help(module: str, topic: str, materials: str, user_questio
     if not key:
         return "Kein API-Key vorhanden. Bitte in den Einstellungen hinzufügen."
 
-    client = OpenAI(api_key=key)
+    client = get_openai_client(key)
     materials_text = materials.strip() if materials else "Keine Materialien angegeben."
     question_text = user_question.strip() if user_question else "keine"
     
@@ -153,56 +327,42 @@ def ask_chatgpt_topic_help(module: str, topic: str, materials: str, user_questio
     return response.choices[0].message.content
 
 
-async def determine_intent(message: str, api_key: Optional[str]) -> str:
+def intent_cache_info() -> dict:
+    return {"size": _intent_cache.currsize, "maxsize": _intent_cache.maxsize}
+
+
+async def determine_intent(message: str, api_key: Optional[str], awaiting_calendar: bool = False) -> str:
     """Asynchronously determine the user's intent using ChatGPT.
 
+    Short explicit commands that match a single local pattern are classified locally.
     Retries on transient errors to be more robust when many requests arrive quickly.
+    Confident classifications (the reply is exactly one label) are cached per normalized
+    message, so repeated messages (e.g. "ja", "nein", greetings) skip the API call.
     """
     msg = message.strip()
-    # Add calendar_yes/calendar_no so short replies like 'Ja'/'Nein' are classified
-    labels = [
-        "get_moodle_appointments",
-        "get_stine_messages",
-        "get_stine_exams",
-        "get_mail",
-        "greeting",
-        "help",
-        "calendar_yes",
-        "calendar_no",
-        "start_exam_wizard",
-        "unknown",
-    ]
-
-    prompt = (
-        "Classify the user's message into exactly one of the following intent labels: "
-        + ", ".join(labels)
-        + ".\nRespond with only the intent label (one of the labels) and nothing else.\n"
-        + "If the user asks about Moodle appointments, deadlines or 'Aufgaben', return 'get_moodle_appointments'.\n"
-        + "If the user asks about Stine messages or 'Stine Nachrichten', return 'get_stine_messages'.\n"
-        + "If the user asks about Stine exams or 'Stine Prüfungen', return 'get_stine_exams'.\n"
-        + "If the user asks about email or 'E-Mail', return 'get_mail'.\n"
-        + "If the message is a greeting (hello, hi, hallo) return 'greeting'.\n"
-        + "If the user asks for help or how to use the bot return 'help'.\n"
-        + "If the user replies with an affirmative like 'ja' (German) or 'yes', return 'calendar_yes'.\n"
-        + "If the user replies with a negative like 'nein' (German) or 'no', return 'calendar_no'.\n"
-        + "If the user wants to start exam prep (e.g., Klausurvorbereitung, Lernplan, Wizard starten), return 'start_exam_wizard'.\n"
-        + "If the user continues within the wizard (follow-ups), return 'wizard_followup'.\n"
-        + f"User message: \"{msg}\"\n"
-    )
+    cache_key = msg.lower()
+    cached = _intent_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    local = classify_intent_locally(msg, awaiting_calendar)
+    if local is not None:
+        return local
 
-    # Blocking call will run in a thread to avoid blocking the event loop.
-    def _call_openai(inner_prompt: str):
-        try:
-            from openai import OpenAI
-        except Exception:
-            raise
+    # Awaited on the event loop with the async client: intent detection runs on every chat
+    # message and should not occupy a thread of the blocking pool while waiting for the API.
+    async def _call_openai(text: str):
         key = pick_api_key(api_key)
         if not key:
             raise RuntimeError("Kein API-Key konfiguriert")
-        client = OpenAI(api_key=key)
-        response = client.chat.completions.create(
+        client = get_async_openai_client(key)
+        response = await client.chat.completions.create(
             model="gpt-5-mini",
-            messages=[{"role": "user", "content": inner_prompt}]
+            messages=[
+                {"role": "system", "content": _INTENT_SYSTEM_PROMPT},
+                {"role": "user", "content": text},
+            ],
+            # Picking one label needs no deliberation; minimal effort skips most reasoning tokens
+            reasoning_effort="minimal",
         )
         return response.choices[0].message.content
 
@@ -210,14 +370,22 @@ async def determine_intent(message: str, api_key: Optional[str]) -> str:
     backoff_base = 0.5
     for attempt in range(1, max_retries + 1):
         try:
-            response = await asyncio.to_thread(_call_openai, prompt)
+            response = await _call_openai(msg)
             # parse the model response robustly
             intent_text = response.strip().splitlines()[0].strip() if response else ""
-            if intent_text in labels:
-                return intent_text
-            for lab in labels:
-                if lab in response:
-                    return lab
+            # Only a reply that is exactly one label counts as confident enough to be cached
+            label = intent_text if intent_text in _INTENT_LABEL_SET else None
+            confident = label is not None
+            if label is None and response:
+                # One pass over the reply; a stray answer only counts if it names exactly one label
+                hits = _INTENT_LABEL_SET.intersection(_LABEL_TOKEN_RE.findall(response.lower()))
+                if len(hits) == 1:
+                    (label,) = hits
+            if label is not None:
+                # 'unknown' is not cached: the same text may classify fine on the next attempt
+                if confident and label != "unknown":
+                    _intent_cache[cache_key] = label
+                return label
             logging.info("ChatGPT returned unexpected intent text (attempt %d): %s", attempt, response)
             # If model returned something unexpected, retry a couple times
         except Exception as e:
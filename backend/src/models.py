@@ -1,6 +1,6 @@
 """Pydantic models for API requests and responses."""
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import List, Optional
 
 
 class ChatRequest(BaseModel):
@@ -22,3 +22,41 @@ class CredentialsResponse(BaseModel):
     username: Optional[str] = None
     password: Optional[str] = None
     api_key: Optional[str] = None
+
+
+class OAuthCallbackRequest(BaseModel):
+    code: str = Field(min_length=1)
+    redirect_uri: str = Field(min_length=1)
+
+
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str = Field(min_length=1)
+
+
+class CalendarEventsRequest(BaseModel):
+    access_token: str = Field(min_length=1)
+    time_min: Optional[str] = None
+    time_max: Optional[str] = None
+
+
+class CalendarEventIn(BaseModel):
+    title: str = Field(min_length=1)
+    date: str = Field(min_length=1)
+
+
+class CreateEventRequest(CalendarEventIn):
+    access_token: str = Field(min_length=1)
+
+
+class UpdateEventRequest(CreateEventRequest):
+    event_id: str = Field(min_length=1)
+
+
+class DeleteEventRequest(BaseModel):
+    access_token: str = Field(min_length=1)
+    event_id: str = Field(min_length=1)
+
+
+class BatchEventRequest(BaseModel):
+    access_token: str = Field(min_length=1)
+    events: List[CalendarEventIn] = Field(min_length=1)
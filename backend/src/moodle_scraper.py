@@ -1,44 +1,56 @@
 """Moodle web scraping functionality."""
 import re
-import time
 import logging
+from contextlib import ExitStack
 from typing import Optional
 
+from src.driver_pool import DriverPool, driver_session, find_first, selenium_api, visible_text
 
-TARGET = "https://lernen.min.uni-hamburg.de/my/"
 
+TARGET = "https://lernen.min.uni-hamburg.de/my/"
 
-def scrape_moodle_text(username: str, password: str, headless: bool = True, max_wait: int = 25) -> str:
-    """Scrape current appointments/tasks from Moodle."""
+# Date lines in the 'Aktuelle Termine' block, e.g. "Morgen, 23:59" or "Montag, 3. Februar, 10:00"
+_DATE_LINE_RE = re.compile(
+    r"^(?:(?:Heute|Morgen|Montag|Dienstag|Mittwoch|Donnerstag|Freitag|Samstag|Sonntag),"
+    r"|\d{1,2}\.\s*[A-Za-zÄÖÜäöü]+\b)"
+)
+
+# The 'Aktuelle Termine' block in the visible page text
+_TERMINE_BLOCK_RE = re.compile(r"(?<=Aktuelle Termine)(.*?)(?=Zum Kalender)", re.DOTALL)
+# Leading accessibility/skip-link words like 'überspringen' or 'zum inhalt springen'
+_SKIP_LINK_RE = re.compile(r"(?i)^\s*(?:überspringen\b[:\-\–\—]?\s*|zum inhalt springen\b[:\-\–\—]?\s*|zum inhalt\b[:\-\–\—]?\s*)")
+_TERMINE_HEADING_RE = re.compile(r"(?i)^\s*Aktuelle Termine\s*[:\-\–\—]?\s*")
+# Upper bound for the scraped text handed to the LLM, so an unexpected page cannot blow up the prompt
+MAX_TERMINE_CHARS = 8000
+# Accept buttons of the cookie/privacy popup (eupopup) shown before login
+_COOKIE_BUTTON_SELECTOR = ".eupopup-button, .eupopup-accept, button[aria-label*='Akzeptieren'], button[data-cookieaccept]"
+
+
+def scrape_moodle_text(username: str, password: str, headless: bool = True, max_wait: int = 25, pool: Optional[DriverPool] = None) -> str:
+    """Scrape current appointments/tasks from Moodle (reusing a driver from `pool` if given)."""
     logging.info(f"[Scraper] Starting Moodle scrape for user: {username}")
     logging.info(f"[Scraper] Headless mode: {headless}, Max wait: {max_wait}")
     
-    # Import heavy/optional deps here so the app can still start without them.
+    # Heavy/optional deps are imported on first use (once) so the app can still start without them.
     try:
-        from selenium import webdriver
-        from selenium.webdriver.common.by import By
-        from selenium.webdriver.chrome.options import Options
-        from selenium.webdriver.support.ui import WebDriverWait
-        from selenium.webdriver.support import expected_conditions as EC
-        from selenium.common.exceptions import TimeoutException
-        from bs4 import BeautifulSoup
+        api = selenium_api()
     except Exception as e:
         # Return a clear message the frontend can display instead of crashing.
         logging.error(f"[Scraper] Failed to import dependencies: {e}")
-        return f"Selenium/bs4 nicht verfügbar: {e}. Installiere 'selenium' und 'beautifulsoup4' und einen passenden ChromeDriver, oder starte den Server mit den Abhängigkeiten." 
+        return f"Selenium nicht verfügbar: {e}. Installiere 'selenium' und einen passenden ChromeDriver, oder starte den Server mit den Abhängigkeiten." 
+    By, EC, WebDriverWait, TimeoutException = api.By, api.EC, api.WebDriverWait, api.TimeoutException
 
-    options = Options()
-    if headless:
-        # older/newer chrome headless flags differ; this should be broadly compatible
-        options.add_argument("--headless")
+    stack = ExitStack()
     try:
         logging.info("[Scraper] Initializing Chrome WebDriver")
-        driver = webdriver.Chrome(options=options)
+        driver = stack.enter_context(driver_session(pool, headless))
     except Exception as e:
         logging.error(f"[Scraper] Chrome WebDriver error: {e}")
         return f"Chrome WebDriver nicht gefunden oder konnte nicht gestartet werden: {e}"
 
     wait = WebDriverWait(driver, max_wait)
+    # Cheap in-page script checks (jQuery.active) poll faster than the 0.5 s default
+    short_wait = WebDriverWait(driver, max_wait, poll_frequency=0.1)
     try:
         logging.info(f"[Scraper] Navigating to {TARGET}")
         driver.get(TARGET)
@@ -46,44 +58,24 @@ def scrape_moodle_text(username: str, password: str, headless: bool = True, max_
         # Login Button - try to click, but handle overlays/cookie popups that may intercept clicks
         try:
             logging.info("[Scraper] Waiting for login button")
-            login_btn = wait.until(EC.element_to_be_clickable((By.XPATH, "//a[contains(., 'Login') or contains(., 'Anmelden')]") ))
-
-            # Helper: attempt several click strategies to avoid ElementClickInterceptedException
-            def try_click(element):
-                try:
-                    # preferred: javascript click (bypasses some overlays)
-                    driver.execute_script("arguments[0].click();", element)
-                    return True
-                except Exception:
-                    try:
-                        element.click()
-                        return True
-                    except Exception:
-                        return False
-
-            # If a cookie/privacy popup blocks clicks, try to close it first
+            # Moodle's login link points to /login/index.php; the cheap CSS match is checked
+            # first on every poll, the text XPath only matters for a changed theme
+            login_btn = wait.until(EC.any_of(
+                EC.element_to_be_clickable((By.CSS_SELECTOR, "a[href*='/login/index.php']")),
+                EC.element_to_be_clickable((By.XPATH, "//a[contains(., 'Login') or contains(., 'Anmelden')]")),
+            ))
+
+            # One script (one WebDriver round trip) closes a cookie/privacy popup that may
+            # intercept clicks and then clicks the login button
             try:
-                # common eupopup cookie button
-                popup_btns = driver.find_elements(By.CSS_SELECTOR, ".eupopup-button, .eupopup-accept, button[aria-label*='Akzeptieren'], button[data-cookieaccept]")
-                if popup_btns:
-                    for b in popup_btns:
-                        try:
-                            driver.execute_script("arguments[0].click();", b)
-                        except Exception:
-                            try:
-                                b.click()
-                            except Exception:
-                                pass
+                driver.execute_script(
+                    "document.querySelectorAll(arguments[1]).forEach(b => { try { b.click(); } catch (e) {} });"
+                    "arguments[0].scrollIntoView({block: 'center'}); arguments[0].click();",
+                    login_btn, _COOKIE_BUTTON_SELECTOR,
+                )
             except Exception:
-                pass
-
-            # finally try to click the login button
-            clicked = try_click(login_btn)
-            if not clicked:
-                # as a last resort, scroll into view and try again
                 try:
-                    driver.execute_script("arguments[0].scrollIntoView({block:'center'});", login_btn)
-                    driver.execute_script("arguments[0].click();", login_btn)
+                    login_btn.click()
                 except Exception:
                     pass
         except TimeoutException:
@@ -96,17 +88,18 @@ def scrape_moodle_text(username: str, password: str, headless: bool = True, max_
         logging.info("[Scraper] Filling in credentials")
         user_field.send_keys(username)
         pass_field.send_keys(password)
-        submit_btn = driver.find_element(By.XPATH, "//button[@name='_eventId_proceed' or contains(., 'Anmelden')]")
+        # The Shibboleth submit button is found by name; the text XPath is only the fallback
+        submit_btn = find_first(driver, (By.NAME, "_eventId_proceed"), (By.XPATH, "//button[contains(., 'Anmelden')]"))
         logging.info("[Scraper] Submitting login form")
         submit_btn.click()
 
         # 2FA (FIDO)
         logging.info("[Scraper] Waiting for 2FA prompt")
         try:
-            fido_radio = wait.until(EC.element_to_be_clickable((By.XPATH, "//input[@name='2fa_method' and @value='fido']")))
+            fido_radio = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, "input[name='2fa_method'][value='fido']")))
             driver.execute_script("arguments[0].click();", fido_radio)
             continue_btn = wait.until(EC.element_to_be_clickable(
-                (By.XPATH, "//button[contains(@class, 'calltoaction') and contains(@class, 'mfa_login')]") ))
+                (By.CSS_SELECTOR, "button[class*='calltoaction'][class*='mfa_login']") ))
             driver.execute_script("arguments[0].click();", continue_btn)
         except TimeoutException:
             pass
@@ -114,44 +107,55 @@ def scrape_moodle_text(username: str, password: str, headless: bool = True, max_
         # Warte auf Aktuelle Termine
         wait.until(EC.presence_of_element_located((By.XPATH, "//*[contains(text(), 'Aktuelle Termine')]") ))
 
-        # Ensure the page is fully loaded before capturing the HTML.
-        # 1) wait for document.readyState == 'complete'
-        # 2) if jQuery is present, wait until there are no active ajax requests
+        # The block is in the DOM now; if jQuery is present, also wait until no ajax request is
+        # still filling it in. readyState 'complete' is not awaited: with the eager page load
+        # strategy it would only add the wait for images and other sub-resources again.
         try:
-            wait.until(lambda d: d.execute_script("return document.readyState") == 'complete')
-            # give a tiny buffer for any final async rendering
-            time.sleep(0.25)
-            try:
-                wait.until(lambda d: d.execute_script("return (typeof jQuery !== 'undefined') ? (jQuery.active === 0) : true"))
-            except Exception:
-                # jQuery check is optional; ignore if it times out or jQuery not present
-                pass
+            short_wait.until(lambda d: d.execute_script("return (typeof jQuery !== 'undefined') ? (jQuery.active === 0) : true"))
         except Exception:
-            # If waiting for readyState times out, continue anyway but log for debugging
+            # jQuery check is optional; continue anyway but log for debugging
             logging.info("Wartezeit für vollständiges Laden der Seite überschritten, fahre mit Erfassen fort.")
 
-        html = driver.page_source
-
-        # Ergänze den sichtbaren Text (für Fälle, in denen Termine als Text sichtbar sind)
-        soup = BeautifulSoup(html, "html.parser")
-        visible_text = soup.get_text(separator="\n", strip=True)
+        # Nur den Text des 'Aktuelle Termine'-Blocks (Moodle-Block calendar_upcoming) auslesen statt der ganzen Seite
+        block_text = visible_text(driver, "[data-block='calendar_upcoming']")
+        if block_text:
+            # Überschrift und Footer-Links ('Zum Kalender', ...) des Blocks abschneiden
+            match = _TERMINE_BLOCK_RE.search(block_text)
+            block = match.group(1).strip() if match else block_text
+            block = _SKIP_LINK_RE.sub("", block)
+            return _TERMINE_HEADING_RE.sub("", block)[:MAX_TERMINE_CHARS]
 
-        # Versuche, den Abschnitt zwischen 'Aktuelle Termine' und 'Zum Kalender' zu extrahieren
-        match = re.search(r"(?<=Aktuelle Termine)(.*?)(?=Zum Kalender)", visible_text, re.DOTALL)
-        if match:
-            block = match.group(1).strip()
-            # Remove leading accessibility/skip-link words like 'überspringen' or 'zum inhalt springen'
-            block = re.sub(r"(?i)^\s*(?:überspringen\b[:\-\–\—]?\s*|zum inhalt springen\b[:\-\–\—]?\s*|zum inhalt\b[:\-\–\—]?\s*)", "", block)
-            block = re.sub(r"(?i)^\s*Aktuelle Termine\s*[:\-\–\—]?\s*", "", block)
-        else:
-            block = visible_text
-        return visible_text
+        # Unbekanntes Markup: auf den sichtbaren Text der ganzen Seite zurückfallen
+        return (visible_text(driver) or "")[:MAX_TERMINE_CHARS]
 
     except Exception as e:
         return f"Fehler beim Scraping: {e}"
 
     finally:
-        try:
-            driver.quit()
-        except Exception:
-            pass
+        stack.close()
+
+
+def parse_moodle_entries(text: str) -> dict:
+    """Parse the scraped 'Aktuelle Termine' text into column arrays.
+
+    Each entry is anchored on its date line: the line before is the title and the line
+    after is the course, unless that line is already the title of the next entry.
+
+    Returns:
+        Dict with equally long lists 'dates', 'titles' and 'courses' (course may be "")
+    """
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    is_date = [bool(_DATE_LINE_RE.match(line)) for line in lines]
+    dates, titles, courses = [], [], []
+    for i, line in enumerate(lines):
+        if not is_date[i] or i == 0 or is_date[i - 1]:
+            continue
+        course = ""
+        if i + 1 < len(lines) and not is_date[i + 1]:
+            # The following line is a course only if it is not itself followed by a date
+            if i + 2 >= len(lines) or not is_date[i + 2]:
+                course = lines[i + 1]
+        dates.append(line)
+        titles.append(lines[i - 1])
+        courses.append(course)
+    return {"dates": dates, "titles": titles, "courses": courses}
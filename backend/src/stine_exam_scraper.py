@@ -1,29 +1,39 @@
 """Stine exam scraping functionality."""
 import re
-import time
 import logging
+from contextlib import ExitStack
 from typing import Optional
 
+from src.driver_pool import DriverPool, driver_session, find_first, selenium_api, visible_text
 
-def scrape_stine_exams(username: str, password: str) -> str:
-    """Scrape exam information from Stine."""
+
+# Start of the exam table on the 'Meine Prüfungen' page
+_EXAMS_CUT_RE = re.compile(r"Wählen Sie ein Semester")
+# Navigation/footer lines that carry no exam information
+_EXAMS_DROP_RE = re.compile(
+    r"abmelden|ausgewählt|termin wechseln|kontakt|impressum|barrierefreiheit|datenschutz",
+    re.IGNORECASE,
+)
+
+
+def scrape_stine_exams(username: str, password: str, pool: Optional[DriverPool] = None) -> str:
+    """Scrape exam information from Stine (reusing a driver from `pool` if given)."""
     URL = "https://www.stine.uni-hamburg.de/scripts/mgrqispi.dll?APPNAME=CampusNet&PRGNAME=EXTERNALPAGES&ARGUMENTS=-N000000000000001,-N000265,-Astartseite"
 
     try:
-        from selenium import webdriver
-        from selenium.webdriver.common.by import By
-        from selenium.webdriver.chrome.options import Options
-        from selenium.webdriver.support.ui import WebDriverWait
-        from selenium.webdriver.support import expected_conditions as EC
-        from selenium.common.exceptions import TimeoutException
-        from bs4 import BeautifulSoup
+        api = selenium_api()
     except Exception as e:
-        return f"Selenium/bs4 nicht verfügbar: {e}. Installiere 'selenium' und 'beautifulsoup4' und einen passenden ChromeDriver, oder starte den Server mit den Abhängigkeiten."
+        return f"Selenium nicht verfügbar: {e}. Installiere 'selenium' und einen passenden ChromeDriver, oder starte den Server mit den Abhängigkeiten."
+    By, EC, WebDriverWait, TimeoutException = api.By, api.EC, api.WebDriverWait, api.TimeoutException
     
-    options = Options()
-    options.add_argument("--headless")
-    driver = webdriver.Chrome(options=options)
+    stack = ExitStack()
+    try:
+        driver = stack.enter_context(driver_session(pool))
+    except Exception as e:
+        return f"Chrome WebDriver nicht gefunden oder konnte nicht gestartet werden: {e}"
     wait = WebDriverWait(driver, 10)
+    # The exam table check polls faster than the 0.5 s default
+    short_wait = WebDriverWait(driver, 10, poll_frequency=0.1)
     try:
         driver.get(URL)
 
@@ -36,7 +46,7 @@ def scrape_stine_exams(username: str, password: str) -> str:
 
         # click on UHH login
         try:
-            uhh_link = wait.until(EC.element_to_be_clickable((By.XPATH, "//a[contains(@class, 'uhhshib')]") ))
+            uhh_link = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, "a[class*='uhhshib']") ))
             driver.execute_script("arguments[0].click();", uhh_link)
         except TimeoutException:
             pass
@@ -47,15 +57,16 @@ def scrape_stine_exams(username: str, password: str) -> str:
         pass_field = wait.until(EC.presence_of_element_located((By.NAME, "j_password")))
         user_field.send_keys(username)
         pass_field.send_keys(password)
-        submit_btn = driver.find_element(By.XPATH, "//button[@name='_eventId_proceed' or contains(., 'Anmelden')]")
+        # The Shibboleth submit button is found by name; the text XPath is only the fallback
+        submit_btn = find_first(driver, (By.NAME, "_eventId_proceed"), (By.XPATH, "//button[contains(., 'Anmelden')]"))
         submit_btn.click()
 
         # 2FA (FIDO)
         try:
-            fido_radio = wait.until(EC.element_to_be_clickable((By.XPATH, "//input[@name='2fa_method' and @value='fido']")))
+            fido_radio = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, "input[name='2fa_method'][value='fido']")))
             driver.execute_script("arguments[0].click();", fido_radio)
             continue_btn = wait.until(EC.element_to_be_clickable(
-                (By.XPATH, "//button[contains(@class, 'calltoaction') and contains(@class, 'mfa_login')]") ))
+                (By.CSS_SELECTOR, "button[class*='calltoaction'][class*='mfa_login']") ))
             driver.execute_script("arguments[0].click();", continue_btn)
         except TimeoutException:
             # No FIDO prompt — continue anyway
@@ -69,11 +80,6 @@ def scrape_stine_exams(username: str, password: str) -> str:
             if href:
                 try:
                     driver.get(href)
-                    # wait for the target page to load
-                    try:
-                        wait.until(lambda d: d.execute_script("return document.readyState") == 'complete')
-                    except Exception:
-                        time.sleep(0.5)
                 except Exception:
                     # navigation failed; try clicking as a fallback
                     try:
@@ -95,15 +101,11 @@ def scrape_stine_exams(username: str, password: str) -> str:
         except TimeoutException:
             # Couldn't find the element by text — try to locate by href pattern (MYEXAMS) as a fallback
             try:
-                exams_elem = driver.find_element(By.XPATH, "//a[contains(@href, 'MYEXAMS') or contains(@href, 'PRGNAME=MYEXAMS')]")
+                exams_elem = driver.find_element(By.CSS_SELECTOR, "a[href*='MYEXAMS']")
                 href = exams_elem.get_attribute("href")
                 if href:
                     try:
                         driver.get(href)
-                        try:
-                            wait.until(lambda d: d.execute_script("return document.readyState") == 'complete')
-                        except Exception:
-                            time.sleep(0.5)
                     except Exception:
                         try:
                             driver.execute_script("arguments[0].click();", exams_elem)
@@ -113,35 +115,35 @@ def scrape_stine_exams(username: str, password: str) -> str:
                 # Give up gracefully; we'll return whatever page is currently loaded
                 pass
 
-        # Now, scrape the whole page text (hopefully the exams page)
-        time.sleep(1)  # wait a bit for content to load
-        html = driver.page_source
-        soup = BeautifulSoup(html, "html.parser")
-        visible_text = soup.get_text(separator="\n", strip=True)
-        return format_exams_text(visible_text)
+        # Now, scrape the whole page text (hopefully the exams page) once its exam table is there
+        try:
+            short_wait.until(EC.presence_of_element_located(
+                (By.XPATH, "//*[contains(text(), 'Wählen Sie ein Semester')]")))
+        except TimeoutException:
+            pass
+        return format_exams_text(visible_text(driver) or "")
     except Exception as e:
         return f"Fehler beim Klick auf die Authentifizierungsoption: {e}"
 
     finally:
-        try:
-            driver.quit()
-        except Exception:
-            pass
+        stack.close()
 
 
 def format_exams_text(raw_text: str) -> str:
     """Format and clean exam text for LLM processing."""
     # First, cut everything before "Veranstaltung/Modul Name Datum"
-    pattern = r"Wählen Sie ein Semester"
-    match = re.search(pattern, raw_text)
+    match = _EXAMS_CUT_RE.search(raw_text)
     if match:
         raw_text = raw_text[match.start():]
     
-    # Second, ignore words like "Abmelden", "Ausgewählt", "Termin wechseln" as well as "Kontakt", "Impressum", "Barrierefreiheit", "Datenschutz"
+    # Second, ignore words like "Abmelden", "Ausgewählt", "Termin wechseln" as well as "Kontakt", "Impressum", "Barrierefreiheit", "Datenschutz".
+    # innerText puts a whole table row on one line with tab-separated cells, so only the
+    # matching cells are dropped; otherwise an exam row with an "Abmelden" action would vanish
+    drop = _EXAMS_DROP_RE.search
     lines = []
     for line in raw_text.splitlines():
-        lower_line = line.lower()
-        if any(x in lower_line for x in ["abmelden", "ausgewählt", "termin wechseln", "kontakt", "impressum", "barrierefreiheit", "datenschutz"]):
-            continue
-        lines.append(line.strip())
+        cells = [cell.strip() for cell in line.split("\t")]
+        kept = [cell for cell in cells if cell and not drop(cell)]
+        if kept:
+            lines.append("\t".join(kept))
     return "\n".join(lines)
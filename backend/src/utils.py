@@ -1,8 +1,30 @@
 """Utility functions for backend."""
 import os
 import sys
+import importlib.util
 from pathlib import Path
-from typing import Optional
+from typing import Any, Optional
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    # orjson is optional; FastJSONResponse falls back to the stdlib encoder without it
+    orjson = None
+
+# httpx speaks HTTP/2 only with the h2 package; Google's APIs then multiplex concurrent
+# calls (e.g. a batch of event inserts) over one connection instead of opening one each
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response serialized with orjson (C-accelerated) when it is installed."""
+
+    def render(self, content: Any) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content)
 
 
 def resolve_frontend_dist() -> Optional[str]:
@@ -14,6 +14,7 @@ import Calendar from './Calendar';
 declare global {
   interface Window {
     addCalendarEvent: (date: string, title: string) => void;
+    addCalendarEvents: (events: { date: string; title: string }[]) => void;
   }
 }
 
@@ -293,6 +294,15 @@ function App() {
                               </button>
                             );
                           })}
+                          {m.suggestedEvents.length > 1 && (
+                            <button
+                              onClick={() => window.addCalendarEvents(m.suggestedEvents!)}
+                              className="inline-block px-3 py-2 bg-green-800 hover:bg-green-900 text-white rounded-lg text-sm font-medium transition-colors"
+                              title="Alle Termine zum Kalender hinzufügen"
+                            >
+                              Alle hinzufügen
+                            </button>
+                          )}
                         </div>
                       )}
                     </>
@@ -175,10 +175,38 @@ function CalendarContent() {
 			alert('Termin hinzugefügt!');
 		};
 
+		// eslint-disable-next-line @typescript-eslint/ban-ts-comment
+		// @ts-ignore
+		window.addCalendarEvents = (items: { date: string; title: string }[]) => {
+			// Skip duplicates (same date AND same title) like addCalendarEvent does
+			const allEvents = [...events, ...googleEvents];
+			const fresh = items.filter(it => !allEvents.some(ev => ev.date === it.date && ev.text === it.title));
+
+			if (fresh.length === 0) {
+				alert('Diese Termine existieren bereits in deinem Kalender!');
+				return;
+			}
+
+			// If user is logged in with Google, send all events in one batch request
+			if (user && accessToken) {
+				syncEventsToGoogleCalendar(fresh, accessToken);
+			} else {
+				const added: CalendarEvent[] = fresh.map(it => ({ id: String(Date.now()) + Math.random().toString(36).slice(2), date: it.date, text: it.title }));
+				const next = [...loadEvents(), ...added];
+				saveEvents(next);
+				setEvents(next);
+			}
+
+			alert(`${fresh.length} Termine hinzugefügt!`);
+		};
+
 		return () => {
 			// eslint-disable-next-line @typescript-eslint/ban-ts-comment
 			// @ts-ignore
 			delete window.addCalendarEvent;
+			// eslint-disable-next-line @typescript-eslint/ban-ts-comment
+			// @ts-ignore
+			delete window.addCalendarEvents;
 		};
 	}, [user, accessToken, events, googleEvents]);
 
@@ -362,6 +390,37 @@ function CalendarContent() {
 		}
 	};
 
+	const syncEventsToGoogleCalendar = async (items: { date: string; title: string }[], token: string) => {
+		try {
+			console.log('Syncing', items.length, 'events to Google Calendar in one batch');
+			const response = await fetch(`${BACKEND_URL}/api/google/calendar/create_batch`, {
+				method: 'POST',
+				headers: {
+					'Content-Type': 'application/json',
+				},
+				body: JSON.stringify({
+					access_token: token,
+					events: items.map(it => ({ title: it.title, date: it.date })),
+				}),
+			});
+
+			const data = await response.json();
+
+			if (!response.ok) {
+				console.error('Backend error response:', response.status, data);
+				throw new Error(data.message || 'Failed to sync events to Google Calendar');
+			}
+
+			const created = (data.results || []).filter((r: any) => r.success).map((r: any) => r.event);
+			console.log(`✓ ${created.length}/${items.length} events synced to Google Calendar`);
+			if (created.length > 0) {
+				setGoogleEvents(prev => [...prev, ...created]);
+			}
+		} catch (e) {
+			console.error('Error syncing events to Google Calendar:', e);
+		}
+	};
+
 	const removeEvent = (id: string) => {
 		// If it's a Google Calendar event
 		if (id.startsWith('google-')) {